@@ -0,0 +1,78 @@
+"""
+Wall time of starting covviz: printing --help and building a report of a
+small cohort. Each case is run in a new interpreter, as in a pipeline.
+
+    python benchmarks/startup.py --repeat 20
+"""
+
+import argparse
+import gzip
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = "from covviz.covviz import cli; cli()"
+
+
+def write_bed(path, n_samples=6, n_bins=500, chroms=("1", "2", "X")):
+    random.seed(42)
+    samples = ["S%d" % i for i in range(n_samples)]
+    with gzip.open(path, "wt") as fh:
+        print("#chrom", "start", "end", *samples, sep="\t", file=fh)
+        for chrom in chroms:
+            for i in range(n_bins):
+                values = ["%.3f" % random.gauss(1, 0.1) for _ in samples]
+                print(chrom, i * 16384, (i + 1) * 16384, *values, sep="\t", file=fh)
+
+
+def run(argv, repeat):
+    """
+    wall times of running the python interpreter with argv
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable] + argv,
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("-n", "--repeat", type=int, default=10)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bed = os.path.join(tmp, "small.bed.gz")
+        write_bed(bed)
+        cases = [
+            # baseline of starting python itself
+            ("interpreter", ["-c", "pass"]),
+            ("--help", ["-c", CLI, "--help"]),
+            ("small report", ["-c", CLI, "-o", os.path.join(tmp, "small.html"), bed]),
+        ]
+        print("case", "min", "median", sep="\t")
+        for name, argv in cases:
+            times = run(argv, args.repeat)
+            print(
+                name,
+                "%.3f" % min(times),
+                "%.3f" % statistics.median(times),
+                sep="\t",
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,17 @@
 import csv
+import io
 import logging
 import os
 import sys
 from collections import defaultdict
-from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, repeat
 
 import numpy as np
-import pandas as pd
 
-from .utils import gzopen
+from .depths import attach, read_depths, release, share
+from .tabix import region_lines
+from .utils import WHOLE_CHROMOSOME, gzopen, in_regions, merge_traces
 
 try:
     from itertools import ifilterfalse as filterfalse
@@ -64,6 +67,44 @@ def validate_samples(samples, groups):
     return valid
 
 
+def significant_runs(samples, outliers, distance_threshold):
+    """
+    yields each sample and its consecutive outlier points that span more than
+    distance_threshold
+    """
+    for sample in samples:
+        for _, consecutive_points in groupby(
+            enumerate(outliers[sample]), lambda x: x[0] - x[1]["index"]
+        ):
+            points = [point for _, point in consecutive_points]
+            if (points[-1]["x"] - points[0]["x"]) > distance_threshold:
+                yield sample, points
+
+
+def write_events(
+    fh, chrom, samples, outliers, distance_threshold, ends, values, columns
+):
+    """
+    write a record per significant run of outliers, see `utils.EVENTS_HEADER`;
+    depths are the normalized, unclipped values of the run
+    """
+    for sample, points in significant_runs(samples, outliers, distance_threshold):
+        index_values = [point["index"] for point in points]
+        depths = values[index_values, columns[sample]]
+        print(
+            chrom,
+            points[0]["x"],
+            int(ends[index_values[-1]]),
+            sample,
+            len(points),
+            round(float(depths.mean()), 3),
+            round(max(abs(point["z"]) for point in points), 2),
+            sep="\t",
+            file=fh,
+        )
+    fh.flush()
+
+
 def get_traces(data, samples, outliers, distance_threshold, slop):
     """
     identify which sample lines need to be plotted and join up the consecutive stretches
@@ -71,61 +112,49 @@ def get_traces(data, samples, outliers, distance_threshold, slop):
     data - defaultdict of row data keyed by 'x' and sample IDs. value is list.
     """
     traces = defaultdict(lambda: defaultdict(list))
-    for sample in samples:
-        for idx, consecutive_points in groupby(
-            enumerate(outliers[sample]), lambda x: x[0] - x[1]["index"]
-        ):
-            index_values = []
-            x_values = []
-            y_values = []
-            for i, point in consecutive_points:
-                index_values.append(point["index"])
-                x_values.append(point["x"])
-                y_values.append(point["y"])
-
-            if (x_values[-1] - x_values[0]) > distance_threshold:
-                extension_length = slop
-                distance_idx = 1
-                while extension_length > 0:
-                    if (index_values[0] - distance_idx) < 0:
-                        break
-                    try:
-                        traces[sample]["x"].insert(
-                            0, data["x"][index_values[0] - distance_idx]
-                        )
-                        traces[sample]["y"].insert(
-                            0, data[sample][index_values[0] - distance_idx]
-                        )
-                    except IndexError:
-                        # x_values[0] is the first data point
-                        break
-                    extension_length -= (
-                        data["x"][index_values[0] - distance_idx + 1]
-                        - data["x"][index_values[0] - distance_idx]
-                    )
-                    distance_idx += 1
-
-                traces[sample]["x"].extend(x_values)
-                traces[sample]["y"].extend(y_values)
-
-                # append slop
-                extension_length = slop
-                distance_idx = 1
-                while extension_length > 0:
-                    try:
-                        traces[sample]["x"].append(
-                            data["x"][index_values[-1] + distance_idx]
-                        )
-                        traces[sample]["y"].append(
-                            data[sample][index_values[-1] + distance_idx]
-                        )
-                    except IndexError:
-                        break
-                    extension_length -= (
-                        data["x"][index_values[-1] + distance_idx]
-                        - data["x"][index_values[-1] + distance_idx - 1]
-                    )
-                    distance_idx += 1
+    for sample, points in significant_runs(samples, outliers, distance_threshold):
+        index_values = [point["index"] for point in points]
+        x_values = [point["x"] for point in points]
+        y_values = [point["y"] for point in points]
+
+        extension_length = slop
+        distance_idx = 1
+        while extension_length > 0:
+            if (index_values[0] - distance_idx) < 0:
+                break
+            try:
+                traces[sample]["x"].insert(0, data["x"][index_values[0] - distance_idx])
+                traces[sample]["y"].insert(
+                    0, data[sample][index_values[0] - distance_idx]
+                )
+            except IndexError:
+                # x_values[0] is the first data point
+                break
+            extension_length -= (
+                data["x"][index_values[0] - distance_idx + 1]
+                - data["x"][index_values[0] - distance_idx]
+            )
+            distance_idx += 1
+
+        traces[sample]["x"].extend(x_values)
+        traces[sample]["y"].extend(y_values)
+
+        # append slop
+        extension_length = slop
+        distance_idx = 1
+        while extension_length > 0:
+            try:
+                traces[sample]["x"].append(data["x"][index_values[-1] + distance_idx])
+                traces[sample]["y"].append(
+                    data[sample][index_values[-1] + distance_idx]
+                )
+            except IndexError:
+                break
+            extension_length -= (
+                data["x"][index_values[-1] + distance_idx]
+                - data["x"][index_values[-1] + distance_idx - 1]
+            )
+            distance_idx += 1
 
     # fix overlapping regions after adding slop
     for sample in samples:
@@ -165,57 +194,87 @@ def parse_sex_groups(filename, sample_col, sex_col):
     return groups
 
 
-def normalize_depths(path):
-    filename, ext = os.path.splitext(path)
-    if ext == ".gz":
-        filename, ext = os.path.splitext(filename)
-
-    output_bed = filename + ".norm.bed.gz"
-    df = pd.read_csv(path, sep="\t", low_memory=False)
-    # omit 0s from median calculation
-    df[df.iloc[:, 3:] == 0] = np.nan
-    # median values per sample
-    global_sample_median = np.nanmedian(df.iloc[:, 3:], axis=0)
-    # normalize each sample
-    df.iloc[:, 3:] = df.iloc[:, 3:] / global_sample_median
-    # generate output file
-    df.to_csv(path_or_buf=output_bed, sep="\t", na_rep=0.0, index=False)
-    return output_bed
-
-
-def identify_outliers(a, threshold=3.5):
+def modified_z_scores(a):
+    """
+    modified z-scores of `a` using its median and median absolute deviation
+    """
+    a = np.asarray(a)
     med = np.median(a)
-    mad = np.median([np.abs(i - med) for i in a])
+    mad = np.median(np.abs(a - med))
     # https://www.ibm.com/support/knowledgecenter/en/SSEP7J_11.1.0/com.ibm.swg.ba.cognos.ug_ca_dshb.doc/modified_z.html
     if mad == 0:
         meanAD = np.mean(np.abs(a - np.mean(a)))
         divisor = 1.253314 * meanAD
-        modified_z_scores = [(i - med) / divisor for i in a]
     else:
         divisor = 1.4826 * mad
-        modified_z_scores = [(i - med) / divisor for i in a]
-    return np.where(np.abs(modified_z_scores) > threshold)
+    return (a - med) / divisor
+
+
+def identify_outliers(a, threshold=3.5):
+    return np.where(np.abs(modified_z_scores(a)) > threshold)
 
 
-def add_roc_traces(path, traces, exclude):
+def reference_z_scores(a, stats):
+    """
+    as modified_z_scores, but using the median and median absolute deviation
+    of a reference panel (stats) rather than those of `a`; values differing
+    from a reference without deviation are infinitely far from it
+    """
+    if stats["mad"] == 0:
+        divisor = 1.253314 * stats["meanad"]
+    else:
+        divisor = 1.4826 * stats["mad"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (np.asarray(a) - stats["median"]) / divisor
+
+
+def get_bounds(sample_values, z_threshold=3.5):
+    """
+    returns indexes of outliers among sample_values, the lower and upper
+    bounds of the remaining values, and the modified z-scores of all values
+    """
+    # skip running test if everything is the same
+    if len(set(sample_values)) == 1:
+        return [], sample_values[0], sample_values[0], np.zeros(len(sample_values))
+    z_scores = modified_z_scores(sample_values)
+    # indexes of passing values
+    passing = np.where(np.abs(z_scores) > z_threshold)[0]
+    # from remaining, grab upper and lower bounds
+    outliers = set(passing)
+    remaining = [v for i, v in enumerate(sample_values) if i not in outliers]
+    return passing, min(remaining), max(remaining), z_scores
+
+
+def add_roc_traces(path, traces, exclude, include=None):
+    """
+    adds proportions covered per sample per chromosome under traces["roc"] and
+    the position of each sample's trace, its column order, under
+    traces["sample_index"]["roc"]
+    """
     traces["roc"] = dict()
-    df = pd.read_csv(path, sep="\t", low_memory=False)
     n_bins = 150
     x_max = 2.5
     traces["roc"]["x_coords"] = [
         round(i, 2) for i in list(np.linspace(0, x_max, n_bins))
     ]
 
-    for chrom, data in df.groupby(df.columns[0]):
-        chrom = str(chrom)
+    if isinstance(path, str):
+        # pre-normalized data
+        path = read_depths(path)
+    samples = path.samples
+
+    traces.setdefault("sample_index", dict(scaled=dict()))
+    traces["sample_index"]["roc"] = {sample: i for i, sample in enumerate(samples)}
+
+    for chrom, _, _, arr in path.blocks():
         # apply exclusions
         if exclude.findall(chrom):
             continue
 
         chrom = chrom[3:] if chrom.startswith("chr") else chrom
+        if include and chrom not in include:
+            continue
 
-        # pre-normalized data
-        arr = np.asarray(data.iloc[:, 3:])
         traces["roc"][chrom] = dict()
 
         for i in range(0, arr.shape[1]):
@@ -225,7 +284,7 @@ def add_roc_traces(path, traces, exclude):
             sums = counts[::-1].cumsum()[::-1]
             # normalize to y_max of 1
             sums = list(sums.astype(float) / max(1, sums[0]))
-            traces["roc"][chrom][df.columns[i + 3]] = [round(i, 2) for i in sums]
+            traces["roc"][chrom][samples[i]] = [round(i, 2) for i in sums]
     return traces
 
 
@@ -241,156 +300,348 @@ def parse_bed(
     slop=500000,
     min_samples=8,
     skip_norm=False,
+    include=None,
+    reference=None,
+    regions=None,
+    events=None,
+    bin_size=None,
+    bin_agg="mean",
+    selected=None,
+    cohort_bounds=False,
+    processes=1,
 ):
+    """
+    path - bed3+ file or in-memory depths, see `depths.Depths`
+    include - optional collection of chromosomes to limit the analysis to,
+              e.g. when computing a single chromosome on a cluster node
+    reference - optional per bin statistics of a reference panel, as returned
+                by `read_reference`, to score samples against instead of
+                the statistics of this cohort
+    regions - optional intervals, see `utils.parse_regions`, to limit the
+              analysis to
+    events - optional open file to write significant runs of outliers to as
+             they are found, see `utils.open_events`
+    bin_size - optional width of bins to aggregate the depths into, by
+               bin_agg, before the analysis, see `depths.aggregate_bins`
+    selected - optional sample IDs to limit the analysis and output to; the
+               columns of other samples are not read unless cohort_bounds,
+               in which case the bounds are of all samples
+    processes - chromosomes analyzed at a time; the depths are shared with
+                the worker processes rather than copied, see `depths.share`
+    """
     bed_traces = dict()
+    # chromosomes having bins that are not in the reference
+    unreferenced = set()
+    # sample to position of its trace in json_output["samples"] per chromosome
+    sample_index = defaultdict(dict)
     # chromosomes, in order of appearance
     chroms = list()
     samples = list()
 
     sex_chroms = [i.strip("chr") for i in sex_chroms.split(",")]
+    if include:
+        include = set(i[3:] if i.startswith("chr") else i for i in include)
 
     groups = None
     if ped:
         groups = parse_sex_groups(ped, sample_col, sex_col)
 
-    if not skip_norm:
-        path = normalize_depths(path)
+    # samples of the columns to read
+    wanted = None if cohort_bounds else selected
+    if isinstance(path, str):
+        if skip_norm:
+            rows = regions
+            if rows is None and include:
+                # rows of other chromosomes are skipped before parsing, or
+                # not read at all from tabix indexed input
+                rows = {chrom: [[0, WHOLE_CHROMOSOME]] for chrom in include}
+            path = read_depths(path, rows, bin_size, bin_agg, wanted)
+        else:
+            # sample medians are taken across all bins, not just the regions
+            path = read_depths(
+                path, bin_size=bin_size, how=bin_agg, samples=wanted
+            ).normalize()
+    else:
+        if wanted:
+            path = path.select(wanted)
+        if bin_size:
+            path = path.rebin(bin_size, bin_agg)
+    if wanted and groups:
+        # groups of the samples whose columns were read
+        read = set(path.samples)
+        groups = {gid: [s for s in v if s in read] for gid, v in groups.items()}
+        groups = {gid: v for gid, v in groups.items() if v}
+    if regions is not None:
+        path = path.subset(regions)
+        if not path.chroms:
+            logger.warning("no bins overlap the given regions")
+    if processes > 1:
+        tasks = [
+            chr
+            for chr in dict.fromkeys(path.chroms)
+            if not exclude.findall(chr)
+            and (not include or (chr[3:] if chr.startswith("chr") else chr) in include)
+        ]
+        if len(tasks) > 1:
+            descriptor = share(path)
+            if descriptor is None:
+                logger.warning(
+                    "no room to share the depths with the workers; "
+                    "sending each worker a copy of its chromosome instead"
+                )
+                sources = [path.only([chr]) for chr in tasks]
+            else:
+                sources = [descriptor] * len(tasks)
+            # the workers attach to the shared copy, or were sent theirs
+            path = None
+            kwargs = dict(
+                exclude=exclude,
+                ped=ped,
+                sample_col=sample_col,
+                sex_col=sex_col,
+                sex_chroms=",".join(sex_chroms),
+                z_threshold=z_threshold,
+                distance_threshold=distance_threshold,
+                slop=slop,
+                min_samples=min_samples,
+                selected=selected,
+                cohort_bounds=cohort_bounds,
+            )
+            try:
+                return parse_chroms(
+                    sources, tasks, kwargs, reference, events, processes
+                )
+            finally:
+                if descriptor is not None:
+                    release(descriptor)
+    # column of each sample in the bins x samples arrays
+    columns = {sample: i for i, sample in enumerate(path.samples)}
 
-    with gzopen(path) as fh:
-        header = fh.readline().strip().split("\t")
-        fh.seek(0)
-        reader = csv.DictReader(fh, delimiter="\t")
-        for chr, entries in groupby(reader, key=lambda i: i[header[0]]):
-            # apply exclusions
-            if exclude.findall(chr):
-                logger.debug("excluding chromosome: %s" % chr)
-                continue
+    for chr, starts, ends, values in path.blocks():
+        # apply exclusions
+        if exclude.findall(chr):
+            logger.debug("excluding chromosome: %s" % chr)
+            continue
 
-            data = defaultdict(list)
-            bounds = dict(upper=[], lower=[])
-            outliers = defaultdict(list)
-            chrom = chr[3:] if chr.startswith("chr") else chr
-            chroms.append(chrom)
-
-            # capture plot area and outlier traces
-            sample_groups = None
-            if chrom in sex_chroms and groups:
-                sample_groups = groups
-
-            for x_index, row in enumerate(entries):
-                if not samples:
-                    samples = [i for i in sorted(row.keys()) if i not in header[:3]]
-                    if groups:
-                        valid = validate_samples(samples, groups)
-                        if not valid:
-                            logger.critical(
-                                "sample ID mismatches exist between ped and bed"
-                            )
-                            sys.exit(1)
-                if sample_groups is None:
-                    sample_groups = {"gid": samples}
-
-                x_value = int(row[header[1]])
-                data["x"].append(x_value)
-
-                for group_index, (gid, samples_of_group) in enumerate(
-                    sample_groups.items()
-                ):
-                    # adds area traces where groups are present (chrs X and Y)
-                    if len(bounds["upper"]) == group_index:
-                        bounds["upper"].append([])
-                        bounds["lower"].append([])
-                    sample_values = []
-                    for sample in samples_of_group:
-                        v = float(row[sample])
-                        if v > 3:
-                            v = 3
+        chrom = chr[3:] if chr.startswith("chr") else chr
+        if include and chrom not in include:
+            continue
+
+        data = defaultdict(list)
+        bounds = dict(upper=[], lower=[])
+        outliers = defaultdict(list)
+        chroms.append(chrom)
+
+        if not samples:
+            samples = sorted(selected or path.samples)
+            # samples that are plotted; with cohort_bounds, the others only
+            # contribute to the bounds
+            shown = set(samples)
+            if groups:
+                valid = validate_samples(path.samples, groups)
+                if not valid:
+                    logger.critical("sample ID mismatches exist between ped and bed")
+                    sys.exit(1)
+            show_all = len(path.samples) <= min_samples and reference is None
+            if show_all and events is not None:
+                logger.warning(
+                    "events are not called when plotting all samples; "
+                    "see --min-samples"
+                )
+
+        # capture plot area and outlier traces
+        sample_groups = {"gid": sorted(path.samples)}
+        if chrom in sex_chroms and groups:
+            sample_groups = groups
+        group_columns = [
+            (gid, samples_of_group, [columns[s] for s in samples_of_group])
+            for gid, samples_of_group in sample_groups.items()
+        ]
+
+        for x_index, (x_value, row) in enumerate(zip(starts.tolist(), values.tolist())):
+            data["x"].append(x_value)
+
+            for group_index, (gid, samples_of_group, cols) in enumerate(group_columns):
+                # adds area traces where groups are present (chrs X and Y)
+                if len(bounds["upper"]) == group_index:
+                    bounds["upper"].append([])
+                    bounds["lower"].append([])
+                sample_values = []
+                for sample, col in zip(samples_of_group, cols):
+                    v = row[col]
+                    if v > 3:
+                        v = 3
+                    if sample in shown:
                         data[sample].append(v)
-                        sample_values.append(v)
-
-                    # skip finding outliers for few samples
-                    if len(samples) <= min_samples:
-                        # save everything as an outlier
-                        for sample in samples_of_group:
-                            outliers[sample].append(
-                                dict(index=x_index, x=x_value, y=data[sample][-1])
-                            )
-                        continue
+                    sample_values.append(v)
 
-                    # skip running test if everything is the same
-                    if len(set(sample_values)) == 1:
-                        bounds["upper"][group_index].append(sample_values[0])
-                        bounds["lower"][group_index].append(sample_values[0])
-                    else:
-                        # indexes of passing values
-                        passing = identify_outliers(sample_values, z_threshold)[0]
-                        # remove those indexes from the list
-                        for j in sorted(passing, reverse=True):
-                            sample_values.pop(j)
-                        # from remaining, grab upper and lower bounds
-                        upper = max(sample_values)
-                        lower = min(sample_values)
-                        bounds["upper"][group_index].append(upper)
-                        bounds["lower"][group_index].append(lower)
-                        required_deviation_from_bounds = 0.3
-                        upper += required_deviation_from_bounds
-                        lower -= required_deviation_from_bounds
-                        # trace data of outliers
-                        for sample in [samples_of_group[j] for j in passing]:
-                            # ensure that this point falls at least slightly outside of normal range
-                            if data[sample][-1] > upper or data[sample][-1] < lower:
-                                outliers[sample].append(
-                                    dict(index=x_index, x=x_value, y=data[sample][-1])
-                                )
-
-            # update the outlier traces
-            traces = get_traces(data, samples, outliers, distance_threshold, slop)
-            json_output = dict(upper=[], lower=[], coords=data["x"], samples=[])
-
-            # add the area traces
-            for trace_index in range(len(bounds["upper"])):
-                for bound in ["lower", "upper"]:
-                    json_output[bound].append(
-                        [round(i, 2) for i in bounds[bound][trace_index]]
-                    )
-            # add the sample traces for the outlier plots atop area traces
-            len_traces = 0
-            for sample, trace_data in traces.items():
-                if not trace_data["x"]:
+                # skip finding outliers for few samples
+                if show_all:
+                    # save everything as an outlier
+                    for sample in samples_of_group:
+                        if sample not in shown:
+                            continue
+                        outliers[sample].append(
+                            dict(index=x_index, x=x_value, y=data[sample][-1])
+                        )
                     continue
-                # y data may be gapped (string separated floats)
-                y_data = list()
-                for v in trace_data["y"]:
-                    try:
-                        y_data.append(round(v, 2))
-                    except TypeError:
-                        y_data.append(v)
-                json_output["samples"].append(
-                    {"name": sample, "x": trace_data["x"], "y": y_data}
+
+                stats = None
+                if reference is not None:
+                    stats = reference.get(chrom, {}).get(x_value, {}).get(gid)
+                    if stats is None and chrom not in unreferenced:
+                        unreferenced.add(chrom)
+                        logger.warning(
+                            "bins of %s are missing from the reference; "
+                            "using this cohort's statistics" % chr
+                        )
+                if stats is not None:
+                    z_scores = reference_z_scores(sample_values, stats)
+                    passing = np.where(np.abs(z_scores) > z_threshold)[0]
+                    lower, upper = stats["lower"], stats["upper"]
+                else:
+                    passing, lower, upper, z_scores = get_bounds(
+                        sample_values, z_threshold
+                    )
+                bounds["upper"][group_index].append(upper)
+                bounds["lower"][group_index].append(lower)
+                required_deviation_from_bounds = 0.3
+                upper += required_deviation_from_bounds
+                lower -= required_deviation_from_bounds
+                # trace data of outliers
+                for j in passing:
+                    sample = samples_of_group[j]
+                    if sample not in shown:
+                        continue
+                    # ensure that this point falls at least slightly outside of normal range
+                    if data[sample][-1] > upper or data[sample][-1] < lower:
+                        outliers[sample].append(
+                            dict(
+                                index=x_index,
+                                x=x_value,
+                                y=data[sample][-1],
+                                z=float(z_scores[j]),
+                            )
+                        )
+
+        if events is not None and not show_all:
+            write_events(
+                events,
+                chr,
+                samples,
+                outliers,
+                distance_threshold,
+                ends,
+                values,
+                columns,
+            )
+
+        # update the outlier traces
+        traces = get_traces(data, samples, outliers, distance_threshold, slop)
+        json_output = dict(upper=[], lower=[], coords=data["x"], samples=[])
+        if not show_all:
+            # called regions, [sample, start, end], see `overlap.annotate_calls`
+            json_output["calls"] = [
+                [sample, points[0]["x"], int(ends[points[-1]["index"]])]
+                for sample, points in significant_runs(
+                    samples, outliers, distance_threshold
                 )
-                len_traces += 1
+            ]
 
-            bed_traces[chrom] = json_output
-            logger.info("plotting %d traces on chrom %s" % (len_traces, chr))
+        # add the area traces
+        for trace_index in range(len(bounds["upper"])):
+            for bound in ["lower", "upper"]:
+                json_output[bound].append(
+                    [round(i, 2) for i in bounds[bound][trace_index]]
+                )
+        # add the sample traces for the outlier plots atop area traces
+        len_traces = 0
+        for sample, trace_data in traces.items():
+            if not trace_data["x"]:
+                continue
+            # y data may be gapped (string separated floats)
+            y_data = list()
+            for v in trace_data["y"]:
+                try:
+                    y_data.append(round(v, 2))
+                except TypeError:
+                    y_data.append(v)
+            sample_index[sample][chrom] = len(json_output["samples"])
+            json_output["samples"].append(
+                {"name": sample, "x": trace_data["x"], "y": y_data}
+            )
+            len_traces += 1
+
+        bed_traces[chrom] = json_output
+        logger.info("plotting %d traces on chrom %s" % (len_traces, chr))
 
     bed_traces["chromosomes"] = chroms
     bed_traces["sample_list"] = samples
+    bed_traces["sample_index"] = dict(scaled=dict(sample_index))
     # bed_traces["sex_chroms"] = sex_chroms
 
     # pass the bed or normed bed
-    add_roc_traces(path, bed_traces, exclude)
+    if cohort_bounds and selected:
+        path = path.select(samples)
+    add_roc_traces(path, bed_traces, exclude, include)
 
     return bed_traces
 
 
-def parse_bed_track(path, traces, exclude):
+def parse_chroms(sources, chroms, kwargs, reference, events, processes):
+    """
+    `parse_bed` of a chromosome per task in worker processes; sources are the
+    descriptor of `depths.share` or the depths of each chromosome. traces are
+    merged and events written in the order of chroms
+    """
+    references = [None] * len(chroms)
+    if reference is not None:
+        # only the statistics of the chromosome are sent to its worker
+        stripped = [chr[3:] if chr.startswith("chr") else chr for chr in chroms]
+        references = [
+            {chrom: reference[chrom]} if chrom in reference else dict()
+            for chrom in stripped
+        ]
+    logger.info("analyzing %d chromosomes, %d at a time" % (len(chroms), processes))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        results = pool.map(
+            parse_shared,
+            sources,
+            chroms,
+            repeat(kwargs),
+            references,
+            repeat(events is not None),
+        )
+        partials = []
+        for chr, (traces, records) in zip(chroms, results):
+            if events is not None:
+                events.write(records)
+                events.flush()
+            partials.append((chr, traces))
+    return merge_traces(partials)
+
+
+def parse_shared(source, chr, kwargs, reference, events):
+    """
+    traces of a chromosome, of the shared depths or of its own copy, and its
+    events as text
+    """
+    depths = attach(source, [chr]) if isinstance(source, dict) else source
+    fh = io.StringIO() if events else None
+    traces = parse_bed(depths, reference=reference, events=fh, **kwargs)
+    return traces, fh.getvalue() if events else ""
+
+
+def parse_bed_track(path, traces, exclude, regions=None, chroms=None):
     """
-    parse a bed file, placing lines per region
+    parse a bed file, placing lines per region; regions optionally limits the
+    track to those intervals, see `utils.parse_regions`, and chroms to those
+    chromosomes, otherwise regions of any are added
     """
     trace_name = os.path.basename(path).partition(".bed")[0]
 
     with gzopen(path) as fh:
-        cleaned = filterfalse(lambda i: i[0] == "#", fh)
+        cleaned = filterfalse(lambda i: i[0] == "#", region_lines(fh, path, regions))
 
         for chrom, entries in groupby(
             cleaned, key=lambda i: i.partition("\t")[0].lstrip("chr")
@@ -398,15 +649,16 @@ def parse_bed_track(path, traces, exclude):
             # apply exclusions
             if exclude.findall(chrom):
                 continue
-            if chrom not in traces:
+            if chroms is not None and chrom not in chroms:
                 continue
+            traces.setdefault(chrom, dict())
 
             if not "annotations" in traces[chrom]:
                 traces[chrom]["annotations"] = {"bed": []}
             if not "bed" in traces[chrom]["annotations"]:
                 traces[chrom]["annotations"]["bed"] = list()
 
-            regions = list()
+            features = list()
             for line in entries:
                 if line.startswith("#"):
                     continue
@@ -414,12 +666,14 @@ def parse_bed_track(path, traces, exclude):
                 # not currently converting 0- and 1-based
                 start = int(toks[1])
                 end = int(toks[2])
+                if regions is not None and not in_regions(regions, chrom, start, end):
+                    continue
                 try:
                     name = toks[3]
                 except IndexError:
                     name = ""
-                regions.append([start, end, name])
+                features.append([start, end, name])
 
-            traces[chrom]["annotations"]["bed"].append([trace_name, regions])
+            traces[chrom]["annotations"]["bed"].append([trace_name, features])
 
     return traces
@@ -0,0 +1,154 @@
+"""
+Content-addressed cache of results, so that identical reruns skip the
+analysis. Entries are keyed by a hash of the contents of the input files,
+the parameters, and the covviz code itself. Least recently used entries are
+evicted beyond a size limit.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+
+logger = logging.getLogger("covviz")
+
+# bytes read at a time when hashing files
+BLOCK_SIZE = 1 << 20
+
+
+def hash_file(h, path):
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(BLOCK_SIZE), b""):
+            h.update(block)
+
+
+def code_fingerprint():
+    """
+    hash of the source and templates of this package
+    """
+    h = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+        for name in sorted(filenames):
+            if name.endswith((".py", ".html")):
+                h.update(name.encode())
+                hash_file(h, os.path.join(dirpath, name))
+    return h.hexdigest()
+
+
+class Cache(object):
+    """
+    directory of cached results limited to max_size bytes
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, paths, params, parent=None):
+        """
+        hash of the contents of paths, of the JSON serializable params, and
+        of the parent key, if any, or else of the code
+        """
+        h = hashlib.sha256()
+        h.update((parent or code_fingerprint()).encode())
+        h.update(json.dumps(params, sort_keys=True).encode())
+        for path in paths:
+            h.update(b"\0")
+            if path:
+                hash_file(h, path)
+        return h.hexdigest()
+
+    def lookup(self, name):
+        """
+        path of the entry or None; entries are touched on use to track how
+        recently they were used
+        """
+        path = os.path.join(self.path, name)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        return path
+
+    def load(self, key):
+        """
+        cached traces of key or None
+        """
+        path = self.lookup(key + ".pickle")
+        if path is None:
+            return None
+        with open(path, "rb") as fh:
+            return pickle.load(fh)
+
+    def save(self, key, traces):
+        with self.writer(key + ".pickle") as fh:
+            pickle.dump(traces, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        self.evict()
+
+    def fetch(self, name, output):
+        """
+        copies the entry to output; returns whether it was cached
+        """
+        path = self.lookup(name)
+        if path is None:
+            return False
+        shutil.copyfile(path, output)
+        return True
+
+    def store(self, name, source):
+        with self.writer(name) as fh, open(source, "rb") as src:
+            shutil.copyfileobj(src, fh)
+        self.evict()
+
+    def writer(self, name):
+        return AtomicWriter(os.path.join(self.path, name))
+
+    def evict(self):
+        """
+        removes the least recently used entries beyond max_size
+        """
+        entries = []
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # removed by a concurrent process
+                pass
+            total -= size
+            logger.debug("evicted %s from the cache" % path)
+
+
+class AtomicWriter(object):
+    """
+    binary file handle that replaces path on a successful close, so that
+    concurrent readers never see partial entries
+    """
+
+    def __init__(self, path):
+        self.path = path
+        fd, self.tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+        self.fh = os.fdopen(fd, "wb")
+
+    def __enter__(self):
+        return self.fh
+
+    def __exit__(self, exc_type, exc, tb):
+        self.fh.close()
+        if exc_type is None:
+            os.replace(self.tmp, self.path)
+        else:
+            os.remove(self.tmp)
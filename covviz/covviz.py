@@ -13,19 +13,58 @@ coverages for all samples at all points.
 
 Annotation tracks, --bed, --gff, and --vcf can be specified more than
 once.
+
+For large cohorts the analysis can be split across nodes: `covviz compute`
+analyzes a subset of chromosomes and `covviz merge` assembles the partial
+results into the report. See `covviz compute --help` and `covviz merge --help`.
+
+The report can also be built straight from alignment indexes, .crai and
+.bai, using `covviz indexes`.
+
+Many cohorts sharing annotation tracks are processed with `covviz batch`,
+and a report per sample of a cohort is written by `covviz per-sample`.
+
+Significant runs of outliers are written as tab-delimited records with
+--events; the HTML report can then be skipped with --no-html.
+
+High resolution depths, e.g. from mosdepth, are aggregated into wider bins
+as they are read using --bin-size.
+
+A subset of a cohort, such as a family, is reviewed with --samples or
+--samples-file; only the columns of those samples are read.
+
+Chromosomes are analyzed in parallel with --workers; the depths are read
+once into a memory-mapped file that the workers share.
+
+Small batches can be scored against a large cohort: `covviz build-reference`
+writes per bin statistics of the cohort that are then used with --reference.
 """
 
 import argparse
+import csv
 import logging
 import os
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-
-from .bed import parse_bed, parse_bed_track
+# jinja2 and the modules using numpy are imported where they are used so
+# that --help, and argument errors, do not wait on them
 from .gff import parse_gff
+from .overlap import annotate_calls, features_near_calls
 from .ped import parse_ped
-from .utils import optimize_coords
+from .utils import (
+    AnnotationTracks,
+    compress_chromosomes,
+    gzopen,
+    merge_partials,
+    open_events,
+    optimize_coords,
+    parse_regions,
+    sample_ped,
+    sample_traces,
+    write_partial,
+)
 from .vcf import parse_vcf
 
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
@@ -38,16 +77,20 @@ class Formatter(
     pass
 
 
-def parse_args():
-    p = argparse.ArgumentParser(description=__doc__, formatter_class=Formatter)
+def add_bed_args(p):
     # this will later be the only requirement
     p.add_argument(
         "bed",
         help=(
             "bed3+ file format with a header defining sample columns "
-            "after chrom, start, and end."
+            "after chrom, start, and end; or the same columns as Arrow "
+            "IPC/Feather (.arrow, .feather, .ipc) or Parquet (.parquet, "
+            ".pq), which require pyarrow"
         ),
     )
+
+
+def add_analysis_args(p):
     p.add_argument(
         "-e",
         "--exclude",
@@ -94,9 +137,6 @@ def parse_args():
             "deviation"
         ),
     )
-    p.add_argument(
-        "-o", "--output", default="covviz_report.html", help="output file path"
-    )
     p.add_argument(
         "--skip-norm",
         action="store_true",
@@ -114,7 +154,90 @@ def parse_args():
             "z-threshold, distance-threshold, and slop"
         ),
     )
+    p.add_argument(
+        "--region",
+        action="append",
+        help=(
+            "limit the analysis, including annotation tracks, to chrom:start-end "
+            "(1-based, inclusive) or to a whole chrom, each extended by --slop; "
+            "may be specified more than once. input that is bgzip compressed "
+            "and tabix indexed is read from the regions alone"
+        ),
+    )
+    p.add_argument(
+        "--reference",
+        help=(
+            "per bin statistics of a reference panel from `covviz "
+            "build-reference`; samples are scored against these rather "
+            "than against each other and --min-samples is ignored"
+        ),
+    )
+    p.add_argument(
+        "--workers",
+        default=1,
+        type=int,
+        help=(
+            "number of chromosomes analyzed at once by worker processes, "
+            "which share a single memory-mapped copy of the depths"
+        ),
+    )
+    add_bin_args(p)
+    add_sample_args(p)
 
+
+def add_sample_args(p):
+    p.add_argument(
+        "--samples",
+        action="append",
+        help=(
+            "comma separated sample IDs to limit the analysis to; the depths "
+            "of other samples are not read. may be specified more than once"
+        ),
+    )
+    p.add_argument(
+        "--samples-file", help="file of sample IDs, one per line, as --samples"
+    )
+    p.add_argument(
+        "--cohort-bounds",
+        action="store_true",
+        help=(
+            "with --samples, read all samples to compute the bounds but only "
+            "plot the selected; otherwise the selected samples are scored "
+            "against one another or against --reference"
+        ),
+    )
+
+
+def bin_size(value):
+    size = int(value)
+    if size < 1:
+        raise argparse.ArgumentTypeError("must be at least 1: %s" % value)
+    return size
+
+
+def add_bin_args(p):
+    p.add_argument(
+        "--bin-size",
+        type=bin_size,
+        help=(
+            "aggregate the input, as it is read, into bins of this width; "
+            "rows are assigned to the bin their start falls in. use with "
+            "high resolution input, e.g. from mosdepth, to analyze it at "
+            "the resolution of indexcov"
+        ),
+    )
+    p.add_argument(
+        "--bin-agg",
+        choices=["mean", "median"],
+        default="mean",
+        help=(
+            "how the rows of a bin are aggregated with --bin-size; the mean is "
+            "weighted by the width of rows"
+        ),
+    )
+
+
+def add_metadata_args(p):
     meta_group = p.add_argument_group("sample metadata")
     meta_group.add_argument(
         "-p", "--ped", help="ped file defining samples, sex, and other metadata"
@@ -133,6 +256,8 @@ def parse_args():
         help="when using --ped, this defines male,female encoding",
     )
 
+
+def add_annotation_args(p):
     annotations_group = p.add_argument_group("annotations")
     annotations_group.add_argument(
         "--bed",
@@ -182,22 +307,369 @@ def parse_args():
             "field in ClinVar"
         ),
     )
-    return p.parse_args()
+    annotations_group.add_argument(
+        "--near-calls",
+        type=int,
+        metavar="DISTANCE",
+        help=(
+            "only include annotation features within this distance of "
+            "significant regions, shrinking reports of large tracks; "
+            "features overlapping each region are listed when hovering it"
+        ),
+    )
 
 
-def cli():
-    args = parse_args()
+def add_output_args(p):
+    p.add_argument(
+        "-o", "--output", default="covviz_report.html", help="output file path"
+    )
+    add_report_args(p)
 
-    env = Environment(
-        loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), "templates")),
-        autoescape=select_autoescape(["html"]),
+
+def add_events_args(p):
+    p.add_argument(
+        "--events",
+        help=(
+            "write each significant run of outliers to this tab-delimited "
+            "file (.tsv or .bed, optionally .gz) as it is found: chrom, start, "
+            "end, sample, number of bins, mean normalized depth, and max |z|"
+        ),
+    )
+    p.add_argument(
+        "--no-html",
+        action="store_true",
+        help="skip the HTML report; requires --events",
+    )
+
+
+def add_cache_args(p):
+    cache_group = p.add_argument_group("cache")
+    cache_group.add_argument(
+        "--cache-dir",
+        help=(
+            "directory of cached results; reruns having identical inputs and "
+            "parameters reuse the traces, events, and report"
+        ),
+    )
+    cache_group.add_argument(
+        "--cache-size",
+        default=2048,
+        type=int,
+        help="size limit of --cache-dir in MB; least recently used results go first",
+    )
+
+
+def add_report_args(p):
+    p.add_argument(
+        "--webgl-traces",
+        default=500,
+        type=int,
+        help=(
+            "line plots with more sample traces than this are drawn with "
+            "WebGL, combining samples of the same color into one trace"
+        ),
+    )
+    p.add_argument(
+        "--webgl-points",
+        default=2000,
+        type=int,
+        help="scatter plots with more points than this are drawn with WebGL",
+    )
+    p.add_argument(
+        "--compress",
+        action="store_true",
+        help=(
+            "deflate compress the data of each chromosome within the report; "
+            "it is inflated by the browser when the chromosome is viewed"
+        ),
+    )
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=Formatter)
+    add_bed_args(p)
+    add_analysis_args(p)
+    add_output_args(p)
+    add_events_args(p)
+    add_metadata_args(p)
+    add_annotation_args(p)
+    add_cache_args(p)
+    return check_events_args(p, p.parse_args(argv))
+
+
+def check_events_args(p, args):
+    if args.no_html and not args.events:
+        p.error("--no-html requires --events")
+    return args
+
+
+def parse_compute_args(argv):
+    p = argparse.ArgumentParser(
+        prog="covviz compute",
+        description=(
+            "analyze a subset of chromosomes and write the partial result "
+            "as gzipped JSON for `covviz merge`. with --skip-norm only the "
+            "rows of --chrom are parsed, and tabix indexed input is only read "
+            "there; otherwise the whole bed is read to normalize it"
+        ),
+        formatter_class=Formatter,
+    )
+    add_bed_args(p)
+    p.add_argument(
+        "-c",
+        "--chrom",
+        action="append",
+        required=True,
+        help="chromosome to analyze; may be specified more than once",
+    )
+    add_analysis_args(p)
+    p.add_argument(
+        "-o", "--output", default="covviz_partial.json.gz", help="output file path"
+    )
+    add_metadata_args(p)
+    return p.parse_args(argv)
+
+
+def parse_merge_args(argv):
+    p = argparse.ArgumentParser(
+        prog="covviz merge",
+        description=(
+            "assemble the partial results of `covviz compute` with annotations "
+            "and sample metadata into the HTML report"
+        ),
+        formatter_class=Formatter,
+    )
+    p.add_argument(
+        "partials",
+        nargs="+",
+        help="output files of `covviz compute`, in plotting order of their chromosomes",
+    )
+    p.add_argument(
+        "-e",
+        "--exclude",
+        default="^HLA,^hs,:,^GL,M,EBV,^NC,^phix,decoy,random$,Un,hap,_alt$",
+        help="chromosome regex to exclude from annotation tracks",
+    )
+    p.add_argument(
+        "-x",
+        "--sex-chroms",
+        default="X,Y",
+        help="sex chromosomes as they are defined in your bed, e.g. chrX,chrY",
+    )
+    add_output_args(p)
+    add_metadata_args(p)
+    add_annotation_args(p)
+    return p.parse_args(argv)
+
+
+def parse_build_reference_args(argv):
+    p = argparse.ArgumentParser(
+        prog="covviz build-reference",
+        description=(
+            "condense a large cohort into per bin statistics (median, MAD, "
+            "and bounds per sample group) to score new samples against "
+            "using --reference"
+        ),
+        formatter_class=Formatter,
+    )
+    add_bed_args(p)
+    p.add_argument(
+        "-e",
+        "--exclude",
+        default="^HLA,^hs,:,^GL,M,EBV,^NC,^phix,decoy,random$,Un,hap,_alt$",
+        help="chromosome regex to exclude from analysis",
+    )
+    p.add_argument(
+        "-x",
+        "--sex-chroms",
+        default="X,Y",
+        help="sex chromosomes as they are defined in your bed, e.g. chrX,chrY",
+    )
+    p.add_argument(
+        "-z",
+        "--z-threshold",
+        default=3.5,
+        type=float,
+        help="outliers beyond this threshold are not included in the bounds",
+    )
+    p.add_argument(
+        "--skip-norm",
+        action="store_true",
+        help=(
+            "skip normalization by global sample median if the depths "
+            "in your .bed are already normalized"
+        ),
+    )
+    add_bin_args(p)
+    p.add_argument(
+        "-o", "--output", default="covviz_reference.tsv.gz", help="output file path"
+    )
+    add_metadata_args(p)
+    return p.parse_args(argv)
+
+
+def parse_indexes_args(argv):
+    p = argparse.ArgumentParser(
+        prog="covviz indexes",
+        description=(
+            "build the report directly from alignment indexes (.crai and/or "
+            ".bai) by estimating scaled depths per 16 KB window, as indexcov"
+        ),
+        formatter_class=Formatter,
+    )
+    p.add_argument("indexes", nargs="+", help=".crai and/or .bai files")
+    p.add_argument(
+        "-f", "--fai", required=True, help="reference .fai matching the alignments"
+    )
+    p.add_argument(
+        "-t",
+        "--processes",
+        type=int,
+        default=None,
+        help="number of index files read in parallel; defaults to the CPU count",
     )
+    add_analysis_args(p)
+    add_output_args(p)
+    add_events_args(p)
+    add_metadata_args(p)
+    add_annotation_args(p)
+    add_cache_args(p)
+    return check_events_args(p, p.parse_args(argv))
 
-    logger.info("parsing bed file (%s)" % args.bed)
 
-    exclude = re.compile(args.exclude.replace("~", "").replace(",", "|"))
+def parse_batch_args(argv):
+    p = argparse.ArgumentParser(
+        prog="covviz batch",
+        description=(
+            "build reports for many cohorts, parsing annotation tracks once "
+            "and spreading cohorts across worker processes"
+        ),
+        formatter_class=Formatter,
+    )
+    p.add_argument(
+        "manifest",
+        help=(
+            "tab-delimited file with a header of cohorts to process; column "
+            "'bed' is required, 'ped' and 'output' are optional. output "
+            "defaults to the name of the bed with a .html extension"
+        ),
+    )
+    p.add_argument(
+        "-t",
+        "--processes",
+        type=int,
+        default=None,
+        help="number of cohorts processed at once; defaults to the CPU count",
+    )
+    add_analysis_args(p)
+    add_report_args(p)
+    add_metadata_args(p)
+    add_annotation_args(p)
+    add_cache_args(p)
+    return p.parse_args(argv)
+
 
-    traces = parse_bed(
+def parse_per_sample_args(argv):
+    p = argparse.ArgumentParser(
+        prog="covviz per-sample",
+        description=(
+            "analyze a cohort once then write a report per sample, having the "
+            "sample's traces and metadata with the bounds of the cohort"
+        ),
+        formatter_class=Formatter,
+    )
+    add_bed_args(p)
+    p.add_argument(
+        "-O",
+        "--output-dir",
+        default="covviz_samples",
+        help="directory of the reports, named by sample ID",
+    )
+    p.add_argument(
+        "-t",
+        "--processes",
+        type=int,
+        default=None,
+        help="number of reports written at once; defaults to the CPU count",
+    )
+    add_analysis_args(p)
+    add_report_args(p)
+    add_metadata_args(p)
+    add_annotation_args(p)
+    return p.parse_args(argv)
+
+
+def read_manifest(path):
+    cohorts = []
+    with gzopen(path) as fh:
+        for row in csv.DictReader(fh, delimiter="\t"):
+            bed = row["bed"]
+            output = row.get("output") or (
+                os.path.basename(bed).partition(".bed")[0] + ".html"
+            )
+            cohorts.append(dict(bed=bed, ped=row.get("ped") or None, output=output))
+    return cohorts
+
+
+def get_exclude(args):
+    return re.compile(args.exclude.replace("~", "").replace(",", "|"))
+
+
+def get_regions(args):
+    if not args.region:
+        return None
+    try:
+        return parse_regions(args.region, args.slop)
+    except ValueError as e:
+        logger.critical(str(e))
+        sys.exit(1)
+
+
+def get_samples(args):
+    """
+    sample IDs of --samples and --samples-file, in order, or None
+    """
+    samples = []
+    for value in args.samples or []:
+        samples.extend(i.strip() for i in value.split(","))
+    if args.samples_file:
+        with gzopen(args.samples_file) as fh:
+            samples.extend(line.strip() for line in fh)
+    samples = list(dict.fromkeys(i for i in samples if i and not i.startswith("#")))
+    if not samples and (args.samples or args.samples_file):
+        logger.critical("no samples were selected")
+        sys.exit(1)
+    if samples:
+        from .depths import read_header
+
+        # checked before any of the analysis, which may otherwise read every
+        # column with --cohort-bounds before selecting them
+        if isinstance(args.bed, str):
+            header = read_header(args.bed)
+            name = args.bed
+        else:
+            header = args.bed.header
+            name = "the indexes"
+        found = set(header[3:])
+        missing = [i for i in samples if i not in found]
+        if missing:
+            logger.critical("samples not found in %s: %s" % (name, ", ".join(missing)))
+            sys.exit(1)
+    return samples or None
+
+
+def run_parse_bed(args, exclude, include=None, events=None):
+    from .bed import parse_bed
+    from .reference import read_reference
+
+    samples = get_samples(args)
+    reference = None
+    if args.reference:
+        logger.info("parsing reference (%s)" % args.reference)
+        reference = read_reference(args.reference)
+    if isinstance(args.bed, str):
+        logger.info("parsing bed file (%s)" % args.bed)
+    return parse_bed(
         args.bed,
         exclude,
         args.ped,
@@ -209,36 +681,502 @@ def cli():
         args.slop,
         args.min_samples,
         args.skip_norm,
+        include,
+        reference,
+        get_regions(args),
+        events,
+        args.bin_size,
+        args.bin_agg,
+        samples,
+        args.cohort_bounds,
+        args.workers,
     )
 
-    traces = optimize_coords(traces)
+
+def get_environment():
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+    return Environment(
+        loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), "templates")),
+        autoescape=select_autoescape(["html"]),
+    )
+
+
+def parse_annotations(traces, args, exclude, regions=None, chroms=None):
+    """
+    adds the --gff, --bed, and --vcf tracks to traces, limited to regions and
+    chroms when given
+    """
+    from .bed import parse_bed_track
 
     if args.gff:
         for gff in args.gff:
             logger.info("parsing gff file (%s)" % gff)
             traces = parse_gff(
-                gff, traces, exclude, ftype=args.gff_feature, regex=args.gff_attr
+                gff,
+                traces,
+                exclude,
+                ftype=args.gff_feature,
+                regex=args.gff_attr,
+                regions=regions,
+                chroms=chroms,
             )
 
     if args.bed_track:
         for bed in args.bed_track:
             logger.info("parsing bed file (%s)" % bed)
-            traces = parse_bed_track(bed, traces, exclude)
+            traces = parse_bed_track(bed, traces, exclude, regions, chroms)
 
     if args.vcf:
         for vcf in args.vcf:
             logger.info("parsing vcf file (%s)" % vcf)
-            traces = parse_vcf(vcf, traces, exclude, regex=args.vcf_info)
+            traces = parse_vcf(
+                vcf,
+                traces,
+                exclude,
+                regex=args.vcf_info,
+                regions=regions,
+                chroms=chroms,
+            )
+    return traces
+
+
+def parse_track(kind, path, exclude, regions, options):
+    """
+    parses a single --gff, --bed, or --vcf track into `AnnotationTracks`;
+    options are those of the parser
+    """
+    from .bed import parse_bed_track
+
+    logger.info("parsing %s file (%s)" % (kind, path))
+    tracks = AnnotationTracks()
+    if kind == "gff":
+        return parse_gff(path, tracks, exclude, regions=regions, **options)
+    if kind == "bed":
+        return parse_bed_track(path, tracks, exclude, regions)
+    return parse_vcf(path, tracks, exclude, regions=regions, **options)
+
 
+def schedule_annotations(pool, args, exclude, regions=None):
+    """
+    submits the parsing of each annotation track, and of the ped, to pool so
+    that they run alongside the coverage analysis; see `collect_annotations`
+    """
+    tracks = []
+    for kind, paths, options in [
+        ("gff", args.gff, dict(ftype=args.gff_feature, regex=args.gff_attr)),
+        ("bed", args.bed_track, dict()),
+        ("vcf", args.vcf, dict(regex=args.vcf_info)),
+    ]:
+        for path in paths or []:
+            tracks.append(
+                pool.submit(parse_track, kind, path, exclude, regions, options)
+            )
+    ped = None
     if args.ped:
+        logger.info("parsing ped file (%s)" % args.ped)
+        ped = pool.submit(
+            parse_ped,
+            args.ped,
+            dict(),
+            args.sample_col,
+            args.sex_chroms,
+            args.sex_vals,
+            [args.sex_col],
+        )
+    return tracks, ped
+
+
+def collect_annotations(scheduled):
+    """
+    waits on the parsers of `schedule_annotations`; returns the tracks, in
+    the order they were given, and the ped
+    """
+    tracks, ped = scheduled
+    merged = AnnotationTracks()
+    for future in tracks:
+        merged.extend(future.result())
+    return merged, ped.result() if ped is not None else None
+
+
+def annotation_pool(args):
+    """
+    worker pool for `schedule_annotations`, or None without tracks or ped
+    """
+    n = sum(len(i or []) for i in [args.gff, args.bed_track, args.vcf])
+    n += 1 if args.ped else 0
+    if n == 0:
+        return None
+    return ProcessPoolExecutor(max_workers=min(n, os.cpu_count() or 1))
+
+
+def render_report(traces, args, exclude, env=None, tracks=None, regions=None, ped=None):
+    """
+    adds annotation tracks and sample metadata to the coverage traces then
+    writes the HTML report
+
+    env - jinja2 environment to reuse across reports
+    tracks - annotation tracks previously parsed into `AnnotationTracks`
+    regions - intervals to limit annotation tracks to when parsing them
+    ped - sample metadata previously parsed by `parse_ped` into a dict
+    """
+    if env is None:
+        env = get_environment()
+
+    traces = optimize_coords(traces)
+
+    if tracks is None:
+        traces = parse_annotations(
+            traces, args, exclude, regions, traces["chromosomes"]
+        )
+    else:
+        traces = tracks.add_to(traces)
+
+    if args.near_calls is not None:
+        traces = features_near_calls(traces, args.near_calls)
+    traces = annotate_calls(traces)
+
+    if ped is not None:
+        traces.update(ped)
+    elif args.ped:
         logger.info("parsing ped file (%s)" % args.ped)
         traces = parse_ped(
-            args.ped, traces, args.sample_col, args.sex_chroms, args.sex_vals
+            args.ped,
+            traces,
+            args.sample_col,
+            args.sex_chroms,
+            args.sex_vals,
+            [args.sex_col],
         )
 
+    if args.compress:
+        traces = compress_chromosomes(traces)
+
     with open(args.output, "w") as fh:
         logger.info("preparing output")
         html_template = env.get_template("covviz.html")
-        print(html_template.render(data=traces), file=fh)
+        print(
+            html_template.render(
+                data=traces,
+                webgl=dict(traces=args.webgl_traces, points=args.webgl_points),
+            ),
+            file=fh,
+        )
+
+
+# arguments that the traces of `parse_bed` depend on
+ANALYSIS_PARAMS = [
+    "exclude",
+    "sex_chroms",
+    "z_threshold",
+    "distance_threshold",
+    "slop",
+    "skip_norm",
+    "min_samples",
+    "region",
+    "bin_size",
+    "bin_agg",
+    "samples",
+    "cohort_bounds",
+    "sample_col",
+    "sex_col",
+]
+# arguments that the report depends on, in addition to the traces
+REPORT_PARAMS = [
+    "gff_feature",
+    "gff_attr",
+    "vcf_info",
+    "sex_vals",
+    "webgl_traces",
+    "webgl_points",
+    "compress",
+    "near_calls",
+]
+
+
+def get_cache(args):
+    if not args.cache_dir:
+        return None
+    from .cache import Cache
+
+    return Cache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+
+def analyze(args, exclude, inputs=None, read_depths=None, env=None, tracks=None):
+    """
+    runs the analysis, writing --events as they are found, then the report
+    unless --no-html. with --cache-dir, the traces, events, and report of an
+    identical earlier run are reused.
+
+    inputs - files the depths are read from; defaults to the bed
+    read_depths - function returning in-memory depths of inputs, called
+                  only when the traces are not cached
+    env, tracks - see `render_report`
+    """
+    cache = get_cache(args)
+    traces = None
+    if cache is not None:
+        inputs = inputs or [args.bed]
+        params = {k: getattr(args, k) for k in ANALYSIS_PARAMS}
+        # sample IDs of `covviz indexes` are the names of the index files
+        params["inputs"] = [os.path.basename(path) for path in inputs]
+        key = cache.key(inputs + [args.ped, args.reference, args.samples_file], params)
+        # the option and name of each track, as the name labels the track
+        track_files = [
+            (option, path)
+            for option, paths in [
+                ("gff", args.gff),
+                ("vcf", args.vcf),
+                ("bed_track", args.bed_track),
+            ]
+            for path in paths or []
+        ]
+        params = {k: getattr(args, k) for k in REPORT_PARAMS}
+        params["tracks"] = [[o, os.path.basename(p)] for o, p in track_files]
+        report_key = cache.key([p for _, p in track_files], params, parent=key)
+        # events are cached as written, compressed or not
+        events_name = key + ".events"
+        if args.events and args.events.endswith(".gz"):
+            events_name += ".gz"
+        events_cached = not args.events or cache.fetch(events_name, args.events)
+        if events_cached and not args.no_html:
+            if cache.fetch(report_key + ".html", args.output):
+                logger.info("reused cached report (%s)" % report_key)
+                return
+        if events_cached:
+            traces = cache.load(key)
+        if traces is not None:
+            logger.info("reused cached traces (%s)" % key)
+
+    # annotation tracks and ped are parsed alongside the coverage analysis
+    pool = None
+    if not args.no_html and tracks is None:
+        pool = annotation_pool(args)
+    if pool is not None:
+        scheduled = schedule_annotations(pool, args, exclude, get_regions(args))
+    ped = None
+    try:
+        if traces is None:
+            if read_depths is not None:
+                args.bed = read_depths()
+            with open_events(args.events) as events:
+                traces = run_parse_bed(args, exclude, events=events)
+            if cache is not None:
+                cache.save(key, traces)
+                if args.events:
+                    cache.store(events_name, args.events)
+        if pool is not None:
+            tracks, ped = collect_annotations(scheduled)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if args.events:
+        logger.info("wrote events (%s)" % args.events)
+    if args.no_html:
+        return
+
+    render_report(traces, args, exclude, env, tracks, get_regions(args), ped)
+    if cache is not None:
+        cache.store(report_key + ".html", args.output)
+
+
+def compute(argv):
+    args = parse_compute_args(argv)
+    traces = run_parse_bed(args, get_exclude(args), args.chrom)
+    logger.info("writing partial result (%s)" % args.output)
+    write_partial(traces, args.output)
+    logger.info("processing complete")
+
+
+def merged_partials(paths):
+    traces = merge_partials(paths)
+    if not traces["chromosomes"]:
+        logger.critical("no chromosomes were plotted in the partial results")
+        sys.exit(1)
+    return traces
+
+
+def merge(argv):
+    args = parse_merge_args(argv)
+    logger.info("merging %d partial results" % len(args.partials))
+    exclude = get_exclude(args)
+    pool = annotation_pool(args)
+    if pool is None:
+        traces = merged_partials(args.partials)
+        render_report(traces, args, exclude)
+    else:
+        with pool:
+            scheduled = schedule_annotations(pool, args, exclude)
+            traces = merged_partials(args.partials)
+            tracks, ped = collect_annotations(scheduled)
+        render_report(traces, args, exclude, tracks=tracks, ped=ped)
+    logger.info("processing complete")
+
+
+def indexes(argv):
+    from .index import read_indexes
+
+    args = parse_indexes_args(argv)
+    exclude = get_exclude(args)
+    logger.info("reading %d alignment indexes" % len(args.indexes))
+    analyze(
+        args,
+        exclude,
+        args.indexes + [args.fai],
+        lambda: read_indexes(
+            args.indexes, args.fai, exclude, args.sex_chroms, args.processes
+        ),
+    )
+    logger.info("processing complete")
+
+
+# per worker process state of `covviz batch`
+_batch = dict()
+
+
+def init_batch_worker(args, tracks):
+    _batch.update(args=args, tracks=tracks, env=get_environment())
+
+
+def run_cohort(cohort):
+    args = argparse.Namespace(**vars(_batch["args"]))
+    args.bed = cohort["bed"]
+    args.ped = cohort["ped"]
+    args.output = cohort["output"]
+    args.events = None
+    args.no_html = False
+    exclude = get_exclude(args)
+    try:
+        analyze(args, exclude, env=_batch["env"], tracks=_batch["tracks"])
+    except (OSError, ValueError, KeyError, SystemExit) as e:
+        # errors of the inputs of a cohort, including those the analysis
+        # logs as critical before exiting, do not stop the other cohorts
+        logger.error("failed to process %s: %r" % (args.bed, e))
+        return False
+    logger.info("wrote %s" % args.output)
+    return True
+
+
+def batch(argv):
+    args = parse_batch_args(argv)
+    exclude = get_exclude(args)
+    cohorts = read_manifest(args.manifest)
+    outputs = [os.path.abspath(c["output"]) for c in cohorts]
+    duplicated = sorted(set(o for o in outputs if outputs.count(o) > 1))
+    if duplicated:
+        logger.critical(
+            "cohorts share the output %s; set the 'output' column of the "
+            "manifest" % ", ".join(duplicated)
+        )
+        sys.exit(1)
+    logger.info("processing %d cohorts" % len(cohorts))
+    # annotations shared across cohorts are parsed once
+    tracks = parse_annotations(AnnotationTracks(), args, exclude, get_regions(args))
+    with ProcessPoolExecutor(
+        max_workers=args.processes,
+        initializer=init_batch_worker,
+        initargs=(args, tracks),
+    ) as pool:
+        results = list(pool.map(run_cohort, cohorts))
+    failed = [c["bed"] for c, ok in zip(cohorts, results) if not ok]
+    if failed:
+        logger.critical("%d of %d cohorts failed" % (len(failed), len(cohorts)))
+        sys.exit(1)
+    logger.info("processing complete")
+
+
+# per worker process state of `covviz per-sample`
+_per_sample = dict()
+
+
+def init_sample_worker(args, traces, tracks, ped):
+    _per_sample.update(
+        args=args, traces=traces, tracks=tracks, ped=ped, env=get_environment()
+    )
+
+
+def sample_report_path(output_dir, sample):
+    return os.path.join(output_dir, re.sub(r"[^\w.-]", "_", sample) + ".html")
+
+
+def run_sample(sample):
+    args = argparse.Namespace(**vars(_per_sample["args"]))
+    args.output = sample_report_path(args.output_dir, sample)
+    ped = _per_sample["ped"]
+    render_report(
+        sample_traces(_per_sample["traces"], sample),
+        args,
+        get_exclude(args),
+        env=_per_sample["env"],
+        tracks=_per_sample["tracks"],
+        ped=None if ped is None else sample_ped(ped, sample),
+    )
+    return args.output
+
+
+def per_sample(argv):
+    args = parse_per_sample_args(argv)
+    exclude = get_exclude(args)
+    # shared by every report
+    tracks, ped = AnnotationTracks(), None
+    pool = annotation_pool(args)
+    if pool is None:
+        traces = run_parse_bed(args, exclude)
+    else:
+        with pool:
+            scheduled = schedule_annotations(pool, args, exclude, get_regions(args))
+            traces = run_parse_bed(args, exclude)
+            tracks, ped = collect_annotations(scheduled)
+    samples = traces["sample_list"]
+    os.makedirs(args.output_dir, exist_ok=True)
+    logger.info("writing %d reports to %s" % (len(samples), args.output_dir))
+    with ProcessPoolExecutor(
+        max_workers=args.processes,
+        initializer=init_sample_worker,
+        initargs=(args, traces, tracks, ped),
+    ) as pool:
+        for output in pool.map(run_sample, samples, chunksize=8):
+            logger.debug("wrote %s" % output)
+    logger.info("processing complete")
+
+
+def reference(argv):
+    from .reference import build_reference
+
+    args = parse_build_reference_args(argv)
+    logger.info("summarizing bed file (%s)" % args.bed)
+    build_reference(
+        args.bed,
+        args.output,
+        get_exclude(args),
+        args.ped,
+        args.sample_col,
+        args.sex_col,
+        args.sex_chroms,
+        args.z_threshold,
+        args.skip_norm,
+        args.bin_size,
+        args.bin_agg,
+    )
+    logger.info("processing complete")
+
+
+SUBCOMMANDS = {
+    "compute": compute,
+    "merge": merge,
+    "build-reference": reference,
+    "indexes": indexes,
+    "batch": batch,
+    "per-sample": per_sample,
+}
+
+
+def cli():
+    argv = sys.argv[1:]
+    if argv and argv[0] in SUBCOMMANDS:
+        SUBCOMMANDS[argv[0]](argv[1:])
+        return
 
+    args = parse_args(argv)
+    analyze(args, get_exclude(args))
     logger.info("processing complete")
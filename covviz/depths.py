@@ -0,0 +1,505 @@
+"""
+In-memory depths of a bed3+ file, read with NumPy alone.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+from operator import itemgetter
+
+import numpy as np
+
+from .tabix import region_lines
+from .utils import gzopen, in_regions
+
+logger = logging.getLogger("covviz")
+
+
+class Depths(object):
+    """
+    depths per chromosome, per sample, laid out like a bed3+ file
+    """
+
+    def __init__(self, header, chroms, starts, ends, values):
+        # per run of a chromosome: arrays of starts, ends, and bins x samples
+        self.header = header
+        self.samples = header[3:]
+        self.chroms = chroms
+        self.starts = starts
+        self.ends = ends
+        self.values = values
+
+    def blocks(self):
+        """
+        (chrom, starts, ends, array of bins x samples) per run of a chromosome
+        """
+        for block in zip(self.chroms, self.starts, self.ends, self.values):
+            yield block
+
+    def only(self, chroms):
+        """
+        depths of the runs of chroms, as views
+        """
+        names, starts, ends, values = [], [], [], []
+        for chrom, s, e, v in self.blocks():
+            if chrom in chroms:
+                names.append(chrom)
+                starts.append(s)
+                ends.append(e)
+                values.append(v)
+        return Depths(self.header, names, starts, ends, values)
+
+    def normalize(self):
+        """
+        scales each sample by its median, omitting 0s from the median; missing
+        values are set to 0
+        """
+        if not self.values:
+            return self
+        a = np.concatenate(self.values)
+        a[a == 0] = np.nan
+        global_sample_median = np.nanmedian(a, axis=0)
+        for values in self.values:
+            values /= global_sample_median
+            values[np.isnan(values)] = 0
+        return self
+
+    def subset(self, regions):
+        """
+        `Depths` of the bins overlapping regions, see `utils.parse_regions`
+        """
+        chroms, starts, ends, values = [], [], [], []
+        for chrom, s, e, v in zip(self.chroms, self.starts, self.ends, self.values):
+            intervals = regions.get(chrom[3:] if chrom.startswith("chr") else chrom)
+            if not intervals:
+                continue
+            keep = np.zeros(len(s), dtype=bool)
+            for start, end in intervals:
+                keep |= (s < end) & (e > start)
+            if not keep.any():
+                continue
+            chroms.append(chrom)
+            starts.append(s[keep])
+            ends.append(e[keep])
+            values.append(v[keep])
+        return Depths(self.header, chroms, starts, ends, values)
+
+    def select(self, samples):
+        """
+        `Depths` of the columns of samples, in that order
+        """
+        if list(samples) == self.samples:
+            return self
+        cols = sample_columns(self.header, samples)
+        return Depths(
+            self.header[:3] + list(samples),
+            self.chroms,
+            self.starts,
+            self.ends,
+            [values[:, cols] for values in self.values],
+        )
+
+    def rebin(self, bin_size, how="mean"):
+        """
+        `Depths` aggregated into bins of bin_size, see `aggregate_bins`
+        """
+        chroms, starts, ends, values = [], [], [], []
+        for chrom, s, e, v in self.blocks():
+            s, e, v = aggregate_bins(s, e, v, bin_size, how)
+            chroms.append(chrom)
+            starts.append(s)
+            ends.append(e)
+            values.append(v)
+        return Depths(self.header, chroms, starts, ends, values)
+
+
+# RAM backed directory of the files of `share`, where available
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def allocate(size, directories):
+    """
+    path and descriptor of a new file of size bytes in the first of
+    directories having room, or (None, None). the blocks are allocated up
+    front where supported, so that a full tmpfs, e.g. the 64 MB /dev/shm of
+    docker, is an OSError here rather than SIGBUS on writing to the mapping.
+    """
+    for directory in dict.fromkeys(d for d in directories if d):
+        stat = os.statvfs(directory)
+        if stat.f_bavail * stat.f_frsize < size:
+            logger.debug("%s has no room for %d bytes" % (directory, size))
+            continue
+        fd, path = tempfile.mkstemp(prefix="covviz.", suffix=".depths", dir=directory)
+        try:
+            if hasattr(os, "posix_fallocate") and size:
+                os.posix_fallocate(fd, 0, size)
+            else:
+                os.ftruncate(fd, size)
+        except OSError as e:
+            logger.debug("unable to allocate in %s: %s" % (directory, e))
+            os.close(fd)
+            os.remove(path)
+            continue
+        return path, fd
+    return None, None
+
+
+def share(depths, directory=SHARED_DIR):
+    """
+    writes depths to a single memory-mapped file for worker processes to
+    `attach` to rather than each receiving a copy. returns its descriptor, a
+    small picklable dict, or None when neither directory nor the temporary
+    directory has room; the file is removed by `release`.
+
+    the file holds the bins x samples values followed by the start and end
+    of each bin; rows of a chromosome are consecutive, from its offset.
+    """
+    n_rows = sum(len(starts) for starts in depths.starts)
+    n_samples = len(depths.samples)
+    values_size = n_rows * n_samples * np.dtype(np.float64).itemsize
+    size = values_size + n_rows * 2 * np.dtype(np.int64).itemsize
+    path, fd = allocate(size, [directory, tempfile.gettempdir()])
+    if path is None:
+        return None
+    descriptor = dict(
+        path=path,
+        shape=(n_rows, n_samples),
+        dtype="float64",
+        header=depths.header,
+        chroms=depths.chroms,
+        offsets=[],
+    )
+    try:
+        values, coords = map_shared(descriptor, "r+")
+        row = 0
+        for _, starts, ends, block in depths.blocks():
+            descriptor["offsets"].append(row)
+            values[row : row + len(starts)] = block
+            coords[row : row + len(starts), 0] = starts
+            coords[row : row + len(starts), 1] = ends
+            row += len(starts)
+        values.flush()
+        coords.flush()
+    except BaseException:
+        os.remove(path)
+        raise
+    finally:
+        os.close(fd)
+    descriptor["offsets"].append(n_rows)
+    logger.debug("shared %d bins of %d samples (%s)" % (n_rows, n_samples, path))
+    return descriptor
+
+
+def map_shared(descriptor, mode="r"):
+    """
+    values and coords (start, end per bin) of the file of `share`
+    """
+    n_rows, n_samples = descriptor["shape"]
+    if n_rows == 0:
+        # empty files can not be mapped
+        return np.empty((n_rows, n_samples)), np.empty((n_rows, 2), dtype=np.int64)
+    values = np.memmap(
+        descriptor["path"],
+        dtype=descriptor["dtype"],
+        mode=mode,
+        shape=(n_rows, n_samples),
+    )
+    coords = np.memmap(
+        descriptor["path"],
+        dtype=np.int64,
+        mode=mode,
+        shape=(n_rows, 2),
+        offset=values.nbytes,
+    )
+    return values, coords
+
+
+def attach(descriptor, chroms=None):
+    """
+    read-only `Depths` of the file of `share`, optionally of some chromosomes
+    only; pages are shared by every process attached to it
+    """
+    values, coords = map_shared(descriptor)
+    offsets = descriptor["offsets"]
+    names, starts, ends, blocks = [], [], [], []
+    for i, chrom in enumerate(descriptor["chroms"]):
+        if chroms is not None and chrom not in chroms:
+            continue
+        first, last = offsets[i], offsets[i + 1]
+        names.append(chrom)
+        starts.append(coords[first:last, 0])
+        ends.append(coords[first:last, 1])
+        blocks.append(values[first:last])
+    return Depths(descriptor["header"], names, starts, ends, blocks)
+
+
+def release(descriptor):
+    """
+    removes the file of `share`; attached processes keep their mapping
+    """
+    try:
+        os.remove(descriptor["path"])
+    except OSError:
+        pass
+
+
+# extensions of inputs read with pyarrow rather than as bed3+ text
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc")
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+# rows of text parsed at a time
+CHUNK_ROWS = 1 << 16
+AGGREGATIONS = ("mean", "median")
+
+
+def sample_columns(header, samples):
+    """
+    positions of samples among the sample columns of header
+    """
+    index = {sample: i for i, sample in enumerate(header[3:])}
+    missing = [sample for sample in samples if sample not in index]
+    if missing:
+        raise ValueError("samples not found in the header: %s" % ", ".join(missing))
+    return [index[sample] for sample in samples]
+
+
+def aggregate_bins(starts, ends, values, bin_size, how="mean"):
+    """
+    aggregates sorted rows of one chromosome into bins of bin_size by the
+    bin their start falls in. the mean is weighted by the width of rows;
+    the median is of the rows. bins start at a multiple of bin_size and end
+    with their last row.
+    """
+    if how not in AGGREGATIONS:
+        raise ValueError("unknown aggregation: %s" % how)
+    if not len(starts):
+        return starts, ends, values
+    bins = starts // bin_size
+    # first row of each bin
+    firsts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    new_starts = bins[firsts] * bin_size
+    new_ends = np.maximum.reduceat(ends, firsts)
+    if how == "mean":
+        widths = (ends - starts).astype(float)
+        totals = np.add.reduceat(values * widths[:, None], firsts, axis=0)
+        new_values = totals / np.add.reduceat(widths, firsts)[:, None]
+    else:
+        sizes = np.diff(np.r_[firsts, len(starts)])
+        new_values = np.empty((len(firsts), values.shape[1]))
+        # bins having the same number of rows are stacked and done at once
+        for size in np.unique(sizes):
+            of_size = sizes == size
+            rows = firsts[of_size][:, None] + np.arange(size)
+            new_values[of_size] = np.median(values[rows], axis=1)
+    return new_starts, new_ends, new_values
+
+
+def from_rows(header, chroms, starts, ends, values):
+    """
+    `Depths` of rows in file order; consecutive rows of a chromosome are
+    grouped as views of the row arrays
+    """
+    # first row of each run of a chromosome
+    firsts = [i for i in range(len(chroms)) if i == 0 or chroms[i] != chroms[i - 1]]
+    names, run_starts, run_ends, run_values = [], [], [], []
+    for first, last in zip(firsts, firsts[1:] + [len(chroms)]):
+        names.append(chroms[first])
+        run_starts.append(starts[first:last])
+        run_ends.append(ends[first:last])
+        run_values.append(values[first:last])
+    logger.debug("read %d bins of %d samples" % (len(chroms), len(header) - 3))
+    return Depths(header, names, run_starts, run_ends, run_values)
+
+
+def read_header(path):
+    """
+    column names of a bed3+ file, or of an Arrow or Parquet table, without
+    reading its rows
+    """
+    if not path.endswith(ARROW_EXTENSIONS + PARQUET_EXTENSIONS):
+        with gzopen(path) as fh:
+            return fh.readline().strip().split("\t")
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(
+            "reading %s requires pyarrow: pip install covviz[arrow]" % path
+        )
+    if path.endswith(PARQUET_EXTENSIONS):
+        return pq.read_schema(path).names
+    return pa.ipc.open_file(path).schema.names
+
+
+def read_columnar(path, regions=None, bin_size=None, how="mean", samples=None):
+    """
+    reads an Arrow IPC (Feather v2) or Parquet table of chrom, start, end, and
+    a column per sample into `Depths`. Arrow files are memory mapped and
+    numeric columns are used without parsing. only the columns of samples,
+    when given, are read.
+    """
+    try:
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(
+            "reading %s requires pyarrow: pip install covviz[arrow]" % path
+        )
+    columns = None
+    if samples is not None:
+        names = read_header(path)
+        sample_columns(names, samples)
+        columns = names[:3] + list(samples)
+    if path.endswith(PARQUET_EXTENSIONS):
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    else:
+        table = feather.read_table(path, columns=columns, memory_map=True)
+    header = table.column_names
+    chroms = [str(c) for c in table.column(0).to_pylist()]
+    starts = table.column(1).to_numpy().astype(np.int64)
+    ends = table.column(2).to_numpy().astype(np.int64)
+    # one copy into bins x samples
+    values = np.empty((table.num_rows, len(header) - 3))
+    for i, name in enumerate(header[3:]):
+        column = table.column(name)
+        # as with NA in text, rather than treating them as a depth
+        if column.null_count:
+            raise ValueError(
+                "%s has %d missing values for %s" % (path, column.null_count, name)
+            )
+        values[:, i] = column.to_numpy()
+    depths = from_rows(header, chroms, starts, ends, values)
+    if regions is not None:
+        depths = depths.subset(regions)
+    if bin_size:
+        depths = depths.rebin(bin_size, how)
+    return depths
+
+
+def parse_rows(path, n_columns, lines, chrom):
+    """
+    starts, ends, and values of text rows of chrom after the chromosome
+    """
+    # text mode of fromstring splits on any whitespace, including newlines
+    try:
+        a = np.fromstring("".join(lines), sep=" ")
+    except ValueError:
+        a = None
+    if a is None or len(a) != len(lines) * n_columns:
+        exit_on_bad_row(path, n_columns, lines, chrom)
+    a = a.reshape(len(lines), n_columns)
+    return a[:, 0].astype(np.int64), a[:, 1].astype(np.int64), a[:, 2:]
+
+
+def exit_on_bad_row(path, n_columns, lines, chrom):
+    """
+    logs the first of lines that is not n_columns numbers, e.g. having NA
+    or a column more or less than the header, and exits
+    """
+    for line in lines:
+        try:
+            valid = len(np.fromstring(line, sep=" ")) == n_columns
+        except ValueError:
+            valid = False
+        if not valid:
+            break
+    logger.critical(
+        "%s has a row without a start, end, and a number per sample of its "
+        "header: %s\t%s" % (path, chrom, line.strip())
+    )
+    sys.exit(1)
+
+
+def read_depths(path, regions=None, bin_size=None, how="mean", samples=None):
+    """
+    reads a tab-delimited bed3+ file having a header of sample IDs into
+    `Depths`; rows are parsed as floats CHUNK_ROWS at a time
+
+    regions - optional intervals, see `utils.parse_regions`, to limit the bins
+              to. bgzip compressed files having a tabix index are only read
+              where they overlap the regions.
+    bin_size - optional width of the bins to aggregate rows into, by `how`,
+               as they are read, so that the rows of high resolution input
+               are never all in memory. see `aggregate_bins`.
+    samples - optional sample IDs of the columns to read, in that order; the
+              other columns are not parsed
+
+    Arrow and Parquet files are read by `read_columnar`.
+    """
+    if path.endswith(ARROW_EXTENSIONS + PARQUET_EXTENSIONS):
+        return read_columnar(path, regions, bin_size, how, samples)
+    if how not in AGGREGATIONS:
+        raise ValueError("unknown aggregation: %s" % how)
+
+    chroms, starts, ends, values = [], [], [], []
+    with gzopen(path) as fh:
+        header = fh.readline().strip().split("\t")
+        keep = None
+        if samples is not None:
+            # start, end, and the columns of samples of the text after chrom
+            cols = sample_columns(header, samples)
+            keep = itemgetter(0, 1, *[i + 2 for i in cols])
+            # text beyond the last of them is not split
+            maxsplit = max(cols) + 3
+            header = header[:3] + list(samples)
+
+        # parsed rows of a bin that may continue in the next chunk
+        pending = []
+
+        def flush(chrom, lines, partial):
+            """
+            parses lines, holding back those of the last bin when partial
+            """
+            rows = parse_rows(path, len(header) - 1, lines, chrom)
+            if bin_size:
+                bins = rows[0] // bin_size
+                if (
+                    partial
+                    and bins[0] == bins[-1]
+                    and (not pending or pending[0][0][0] // bin_size == bins[0])
+                ):
+                    pending.append(rows)
+                    return
+                pending.append(rows)
+                s, e, v = (np.concatenate(x) for x in zip(*pending))
+                del pending[:]
+                if partial:
+                    # first row of the last bin
+                    n = int(np.searchsorted(s // bin_size, s[-1] // bin_size))
+                    pending.append((s[n:], e[n:], v[n:]))
+                    s, e, v = s[:n], e[:n], v[:n]
+                rows = aggregate_bins(s, e, v, bin_size, how)
+            chroms.extend([chrom] * len(rows[0]))
+            starts.append(rows[0])
+            ends.append(rows[1])
+            values.append(rows[2])
+
+        chunk_chrom, lines = None, []
+        for line in region_lines(fh, path, regions):
+            chrom, _, rest = line.partition("\t")
+            if not rest or chrom.startswith("#"):
+                continue
+            if regions is not None:
+                start, end, _ = rest.split("\t", 2)
+                key = chrom[3:] if chrom.startswith("chr") else chrom
+                if not in_regions(regions, key, int(start), int(end)):
+                    continue
+            if keep is not None:
+                rest = "\t".join(keep(rest.split(None, maxsplit))) + "\n"
+            # chunks hold a single chromosome
+            if chrom != chunk_chrom or len(lines) >= CHUNK_ROWS:
+                if lines:
+                    flush(chunk_chrom, lines, chrom == chunk_chrom)
+                chunk_chrom, lines = chrom, []
+            lines.append(rest)
+        if lines:
+            flush(chunk_chrom, lines, False)
+    if not chroms:
+        return Depths(header, [], [], [], [])
+    return from_rows(
+        header,
+        chroms,
+        np.concatenate(starts),
+        np.concatenate(ends),
+        np.concatenate(values),
+    )
@@ -2,7 +2,8 @@ import os
 import re
 from itertools import groupby
 
-from .utils import gzopen
+from .tabix import region_lines
+from .utils import gzopen, in_regions
 
 try:
     from itertools import ifilterfalse as filterfalse
@@ -10,16 +11,20 @@ except ImportError:
     from itertools import filterfalse
 
 
-def parse_gff(path, traces, exclude, ftype="gene", regex="Name="):
+def parse_gff(
+    path, traces, exclude, ftype="gene", regex="Name=", regions=None, chroms=None
+):
     """
     Grabs the gene name from the attrs field where 'Name=<symbol>;' is present.
+    Genes are optionally limited to regions, see `utils.parse_regions`, and
+    to chroms; genes of any chromosome are added when chroms is None.
 
     returns:
         dict of lists
     """
     trace_name = os.path.basename(path).partition(".gff")[0].partition(".gtf")[0]
     with gzopen(path) as fh:
-        cleaned = filterfalse(lambda i: i[0] == "#", fh)
+        cleaned = filterfalse(lambda i: i[0] == "#", region_lines(fh, path, regions))
         name_re = re.compile(r"%s([^;]*)" % regex)
         for chrom, entries in groupby(
             cleaned, key=lambda i: i.partition("\t")[0].lstrip("chr")
@@ -28,8 +33,9 @@ def parse_gff(path, traces, exclude, ftype="gene", regex="Name="):
             if exclude.findall(chrom):
                 continue
             # don't include genes whose chrom is not being plotted
-            if chrom not in traces:
+            if chroms is not None and chrom not in chroms:
                 continue
+            traces.setdefault(chrom, dict())
 
             genes = list()
 
@@ -47,6 +53,10 @@ def parse_gff(path, traces, exclude, ftype="gene", regex="Name="):
                 # not currently converting 0- and 1-based
                 start = int(toks[3])
                 end = int(toks[4])
+                if regions is not None and not in_regions(
+                    regions, chrom, start - 1, end
+                ):
+                    continue
                 try:
                     name = name_re.findall(toks[8])[0]
                     name = name.strip('"').strip("'")
@@ -0,0 +1,170 @@
+"""
+Scaled depths estimated directly from alignment indexes (.crai and .bai), as
+done by goleft indexcov, without a separate bed3+ intermediate.
+
+For .bai, the size of each 16 KB window is the difference of consecutive
+offsets of the linear index into the compressed BAM. For .crai, the size of
+each slice is spread across the windows its alignments span. Window sizes
+of each sample are then scaled by that sample's median, making 1 the
+expected depth.
+"""
+
+import gzip
+import logging
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+from .depths import Depths
+
+logger = logging.getLogger("covviz")
+
+TILE = 16384
+
+
+def read_fai(path):
+    """
+    returns list of (chrom, length) in order of the .fai
+    """
+    refs = []
+    with open(path) as fh:
+        for line in fh:
+            toks = line.rstrip("\n").split("\t")
+            refs.append((toks[0], int(toks[1])))
+    return refs
+
+
+def crai_sizes(path, lengths):
+    """
+    bytes of CRAM slices per window; list of arrays in order of lengths
+    """
+    n_tiles = np.array([length // TILE + 1 for length in lengths], dtype=np.int64)
+    # offset of each reference's first window
+    offsets = np.cumsum(n_tiles) - n_tiles
+    with gzip.open(path, "rt") as fh:
+        crai = np.array([line.split("\t") for line in fh], dtype=np.int64)
+    crai = crai.reshape(-1, 6)
+    seq_id, start, span, size = crai[:, 0], crai[:, 1] - 1, crai[:, 2], crai[:, 5]
+    # skip unmapped (-1) and multi-reference (-2) slices
+    ok = (seq_id >= 0) & (seq_id < len(lengths)) & (span > 0)
+    seq_id, start, span, size = seq_id[ok], start[ok], span[ok], size[ok]
+    end = start + span
+    first = start // TILE
+    last = np.minimum((end - 1) // TILE, n_tiles[seq_id] - 1)
+    counts = np.maximum(last - first + 1, 0)
+
+    # one entry per window spanned by each slice
+    slices = np.repeat(np.arange(len(first)), counts)
+    tiles = (
+        first[slices]
+        + np.arange(counts.sum())
+        - np.repeat(np.cumsum(counts) - counts, counts)
+    )
+    # spread the slice across its windows by overlapping bases
+    overlap = np.minimum(end[slices], (tiles + 1) * TILE) - np.maximum(
+        start[slices], tiles * TILE
+    )
+    sizes = np.bincount(
+        offsets[seq_id[slices]] + tiles,
+        weights=size[slices] * overlap / span[slices],
+        minlength=n_tiles.sum(),
+    )
+    return np.split(sizes, np.cumsum(n_tiles)[:-1])
+
+
+def bai_sizes(path, lengths):
+    """
+    bytes of BAM compressed data per window from the linear index; list of
+    arrays in order of lengths
+    """
+    with open(path, "rb") as fh:
+        buf = fh.read()
+    if buf[:4] != b"BAI\1":
+        raise ValueError("%s is not a BAM index" % path)
+    n_ref = struct.unpack_from("<i", buf, 4)[0]
+    offset = 8
+    sizes = []
+    for ref in range(n_ref):
+        n_bin = struct.unpack_from("<i", buf, offset)[0]
+        offset += 4
+        for _ in range(n_bin):
+            _, n_chunk = struct.unpack_from("<Ii", buf, offset)
+            offset += 8 + n_chunk * 16
+        n_intv = struct.unpack_from("<i", buf, offset)[0]
+        offset += 4
+        ioffsets = np.frombuffer(buf, dtype="<u8", count=n_intv, offset=offset)
+        offset += n_intv * 8
+        if ref >= len(lengths):
+            continue
+        n_tiles = lengths[ref] // TILE + 1
+        # virtual offsets; upper 48 bits are the compressed file offset
+        coffsets = (ioffsets >> np.uint64(16)).astype(float)
+        window = np.zeros(n_tiles)
+        n = min(n_tiles, max(len(coffsets) - 1, 0))
+        window[:n] = np.clip(np.diff(coffsets)[:n], 0, None)
+        sizes.append(window)
+    # references without any reads may be missing from the index
+    for ref in range(len(sizes), len(lengths)):
+        sizes.append(np.zeros(lengths[ref] // TILE + 1))
+    return sizes
+
+
+def sample_name(path):
+    name = os.path.basename(path)
+    for ext in [".crai", ".bai", ".cram", ".bam"]:
+        if name.endswith(ext):
+            name = name[: -len(ext)]
+    return name
+
+
+def scaled_sizes(path, lengths, keep):
+    """
+    window sizes of an index scaled by their median across chromosomes
+    flagged in keep
+    """
+    if path.endswith(".crai"):
+        sizes = crai_sizes(path, lengths)
+    elif path.endswith(".bai"):
+        sizes = bai_sizes(path, lengths)
+    else:
+        raise ValueError("unsupported index format: %s" % path)
+    values = np.concatenate([s for s, k in zip(sizes, keep) if k])
+    values = values[values > 0]
+    median = np.median(values) if len(values) else 1
+    return [s / median for s in sizes]
+
+
+def read_indexes(paths, fai, exclude, sex_chroms="X,Y", processes=None):
+    """
+    scaled depths of .crai and/or .bai files, read in parallel across
+    `processes` worker processes
+    """
+    refs = read_fai(fai)
+    lengths = [l for _, l in refs]
+    sex_chroms = set(i.strip("chr") for i in sex_chroms.split(","))
+    # chromosomes used to find the median of each sample
+    keep = [
+        not exclude.findall(c) and c.lstrip("chr") not in sex_chroms for c, _ in refs
+    ]
+    samples = [sample_name(p) for p in paths]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        sizes = list(pool.map(scaled_sizes, paths, repeat(lengths), repeat(keep)))
+
+    chroms, starts, ends, values = [], [], [], []
+    for idx, (chrom, length) in enumerate(refs):
+        if exclude.findall(chrom):
+            continue
+        # full windows only, as indexcov
+        n_tiles = length // TILE
+        if n_tiles == 0:
+            continue
+        chroms.append(chrom)
+        starts.append(np.arange(0, n_tiles * TILE, TILE))
+        ends.append(starts[-1] + TILE)
+        values.append(np.column_stack([s[idx][:n_tiles] for s in sizes]))
+    logger.info("read %d indexes across %d chromosomes" % (len(paths), len(chroms)))
+    header = ["#chrom", "start", "end"] + samples
+    return Depths(header, chroms, starts, ends, values)
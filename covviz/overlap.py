@@ -0,0 +1,122 @@
+"""
+Overlap of called regions with the features of annotation tracks, found by
+sweeping intervals sorted by start.
+"""
+
+
+def sweep_overlaps(queries, features):
+    """
+    indexes of the features overlapping each query, where both are lists of
+    0-based, half-open (start, end) sorted by start
+    """
+    hits = []
+    # features starting before the end of the current query
+    active = []
+    j = 0
+    for start, end in queries:
+        while j < len(features) and features[j][0] < end:
+            active.append(j)
+            j += 1
+        # features that end before this query also end before the next ones
+        active = [k for k in active if features[k][1] > start]
+        hits.append([k for k in active if features[k][0] < end])
+    return hits
+
+
+def feature_intervals(kind, track):
+    """
+    0-based, half-open intervals of the features of a track, as parsed by
+    `parse_gff`, `parse_bed_track`, or `parse_vcf`, with their labels
+    """
+    if kind == "vcf":
+        return [(x - 1, x) for x in track["x"]], track["text"]
+    # gff is 1-based and inclusive
+    offset = 1 if kind == "gff" else 0
+    return [(start - offset, end) for start, end, _ in track], [
+        name for _, _, name in track
+    ]
+
+
+def sorted_intervals(intervals):
+    """
+    intervals sorted by start and the original index of each
+    """
+    order = sorted(range(len(intervals)), key=lambda i: intervals[i][0])
+    return [intervals[i] for i in order], order
+
+
+def annotate_calls(traces):
+    """
+    adds to each called region, [sample, start, end], the names of the
+    overlapping --gff and --bed features and the number of --vcf records:
+    [sample, start, end, dict(gff=[names], bed=[names], vcf=count)]
+    """
+    for chrom in traces["chromosomes"]:
+        section = traces[chrom]
+        if not section.get("calls") or not section.get("annotations"):
+            continue
+        calls, call_order = sorted_intervals(
+            [tuple(call[1:3]) for call in section["calls"]]
+        )
+        found = [dict() for _ in calls]
+        for kind, tracks in section["annotations"].items():
+            for _, track in tracks:
+                intervals, labels = feature_intervals(kind, track)
+                features, order = sorted_intervals(intervals)
+                for i, hit in enumerate(sweep_overlaps(calls, features)):
+                    if kind == "vcf":
+                        found[i]["vcf"] = found[i].get("vcf", 0) + len(hit)
+                    elif hit:
+                        names = found[i].setdefault(kind, [])
+                        for k in hit:
+                            if labels[order[k]] not in names:
+                                names.append(labels[order[k]])
+        annotated = list(section["calls"])
+        for i, index in enumerate(call_order):
+            annotated[index] = list(section["calls"][index][:3]) + [found[i]]
+        # a new list, as the calls may be shared with other reports
+        section["calls"] = annotated
+    return traces
+
+
+def features_near_calls(traces, distance):
+    """
+    limits the features of annotation tracks to those within distance of a
+    called region. chromosomes without called regions, e.g. when all samples
+    are plotted, are left as they are.
+    """
+    for chrom in traces["chromosomes"]:
+        section = traces[chrom]
+        if "calls" not in section or not section.get("annotations"):
+            continue
+        # merged extents of the calls
+        regions = []
+        for start, end in sorted(
+            (c[1] - distance, c[2] + distance) for c in section["calls"]
+        ):
+            if regions and start <= regions[-1][1]:
+                regions[-1][1] = max(regions[-1][1], end)
+            else:
+                regions.append([start, end])
+        annotations = dict()
+        for kind, tracks in section["annotations"].items():
+            annotations[kind] = []
+            for name, track in tracks:
+                intervals, _ = feature_intervals(kind, track)
+                features, order = sorted_intervals(intervals)
+                keep = sorted(
+                    order[i]
+                    for i, hit in enumerate(sweep_overlaps(features, regions))
+                    if hit
+                )
+                if kind == "vcf":
+                    track = dict(
+                        x=[track["x"][i] for i in keep],
+                        text=[track["text"][i] for i in keep],
+                    )
+                else:
+                    track = [track[i] for i in keep]
+                annotations[kind].append([name, track])
+        # a new dict, as tracks may be shared across reports
+        section["annotations"] = annotations
+    return traces
@@ -1,8 +1,11 @@
 import csv
+import logging
 from collections import defaultdict
 
 from .utils import gzopen
 
+logger = logging.getLogger("covviz")
+
 
 def check_ped_header(header, cols):
     """
@@ -17,7 +20,31 @@ def check_ped_header(header, cols):
     return is_indexcov
 
 
-def parse_ped(path, traces, sample_col, sex_chroms, sex_vals="1,2"):
+def informative_columns(header, rows, keep):
+    """
+    header (list) - ped header columns
+    rows (list) - lists of row values in the order of header
+    keep (list) - columns to always retain
+
+    returns indexes of columns which vary across samples or are in keep
+    """
+    if len(rows) < 2:
+        return list(range(len(header)))
+    idxs = []
+    for i, col in enumerate(header):
+        first = rows[0][i]
+        if col in keep or any(row[i] != first for row in rows):
+            idxs.append(i)
+    return idxs
+
+
+def parse_ped(path, traces, sample_col, sex_chroms, sex_vals="1,2", keep=()):
+    """
+    the ped table is stored column-wise under traces["ped"] as
+    dict(columns=[names], data=[[values of column], ...]), dropping columns
+    that have the same value for every sample unless they are sample_col or
+    in keep. traces["ped_index"] maps sample ID to row index.
+    """
     table_data = list()
     ped_data = dict(
         inferred=defaultdict(list), bins=defaultdict(list), pca=defaultdict(list)
@@ -48,9 +75,6 @@ def parse_ped(path, traces, sample_col, sex_chroms, sex_vals="1,2"):
 
     with gzopen(path) as fh:
         header = fh.readline().strip().split("\t")
-        # datatables needs these escaped
-        datatable_cols = [dict(title=i, data=i.replace(".", "\\.")) for i in header]
-        table_data.append(datatable_cols)
         fh.seek(0)
         reader = csv.DictReader(fh, delimiter="\t")
 
@@ -69,7 +93,7 @@ def parse_ped(path, traces, sample_col, sex_chroms, sex_vals="1,2"):
                         row[k] = float(v)
 
             # coerced vals saved in data.ped
-            table_data.append(row)
+            table_data.append([row[col] for col in header])
 
             if via_indexcov:
                 # inferred sex
@@ -119,7 +143,22 @@ def parse_ped(path, traces, sample_col, sex_chroms, sex_vals="1,2"):
                 except KeyError:
                     pass
 
-    traces["ped"] = table_data
+    idxs = informative_columns(header, table_data, [sample_col] + list(keep))
+    dropped = [col for i, col in enumerate(header) if i not in idxs]
+    if dropped:
+        logger.info(
+            "leaving out ped columns having the same value for every sample: %s"
+            % ", ".join(dropped)
+        )
+    traces["ped"] = dict(
+        columns=[header[i] for i in idxs],
+        data=[[row[i] for row in table_data] for i in idxs],
+    )
+    sample_idx = header.index(sample_col) if sample_col in header else None
+    traces["ped_index"] = dict()
+    if sample_idx is not None:
+        for i, row in enumerate(table_data):
+            traces["ped_index"][row[sample_idx]] = i
     traces["sample_column"] = sample_col
     if via_indexcov:
         traces["depth"] = ped_data
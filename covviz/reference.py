@@ -0,0 +1,123 @@
+import csv
+import gzip
+import logging
+
+import numpy as np
+
+from .bed import get_bounds, parse_sex_groups
+from .depths import read_depths
+from .utils import gzopen
+
+logger = logging.getLogger("covviz")
+
+REFERENCE_HEADER = [
+    "#chrom",
+    "start",
+    "end",
+    "group",
+    "median",
+    "mad",
+    "meanad",
+    "lower",
+    "upper",
+    "n",
+]
+
+
+def bin_statistics(values, z_threshold=3.5):
+    """
+    per bin statistics of a group of samples: median, median absolute
+    deviation, mean absolute deviation (used when MAD is 0), and the lower
+    and upper bounds of the non-outlier values
+    """
+    a = np.asarray(values)
+    med = np.median(a)
+    mad = np.median(np.abs(a - med))
+    meanad = np.mean(np.abs(a - np.mean(a)))
+    _, lower, upper, _ = get_bounds(values, z_threshold)
+    return dict(median=med, mad=mad, meanad=meanad, lower=lower, upper=upper)
+
+
+def build_reference(
+    path,
+    output,
+    exclude,
+    ped=None,
+    sample_col="sample_id",
+    sex_col="sex",
+    sex_chroms="X,Y",
+    z_threshold=3.5,
+    skip_norm=False,
+    bin_size=None,
+    bin_agg="mean",
+):
+    """
+    condense a cohort into per bin, per sample group statistics written as
+    tab-delimited text to `output`; on sex chromosomes samples are grouped
+    by the sex column of `ped`. with bin_size, depths are aggregated as by
+    `parse_bed` so that the bins match those of samples scored against it.
+    """
+    sex_chroms = [i.strip("chr") for i in sex_chroms.split(",")]
+
+    groups = None
+    if ped:
+        groups = parse_sex_groups(ped, sample_col, sex_col)
+
+    depths = read_depths(path, bin_size=bin_size, how=bin_agg)
+    if not skip_norm:
+        depths.normalize()
+    columns = {sample: i for i, sample in enumerate(depths.samples)}
+
+    opener = gzip.open if output.endswith(".gz") else open
+    with opener(output, "wt") as out:
+        print(*REFERENCE_HEADER, sep="\t", file=out)
+        for chr, starts, ends, values in depths.blocks():
+            if exclude.findall(chr):
+                continue
+            chrom = chr[3:] if chr.startswith("chr") else chr
+            sample_groups = {"gid": depths.samples}
+            if chrom in sex_chroms and groups:
+                sample_groups = groups
+            group_columns = [
+                (gid, [columns[s] for s in samples_of_group])
+                for gid, samples_of_group in sample_groups.items()
+            ]
+            logger.info("summarizing %s" % chr)
+
+            for start, end, row in zip(starts.tolist(), ends.tolist(), values.tolist()):
+                for gid, cols in group_columns:
+                    group_values = [min(row[i], 3) for i in cols]
+                    stats = bin_statistics(group_values, z_threshold)
+                    print(
+                        chrom,
+                        start,
+                        end,
+                        gid,
+                        *[
+                            round(float(stats[k]), 4)
+                            for k in ["median", "mad", "meanad", "lower", "upper"]
+                        ],
+                        len(group_values),
+                        sep="\t",
+                        file=out,
+                    )
+    return output
+
+
+def read_reference(path):
+    """
+    returns dict of chrom -> start -> group -> statistics
+    """
+    reference = dict()
+    with gzopen(path) as fh:
+        reader = csv.DictReader(fh, delimiter="\t")
+        for row in reader:
+            bins = reference.setdefault(row["#chrom"], dict())
+            bins.setdefault(int(row["start"]), dict())[row["group"]] = dict(
+                median=float(row["median"]),
+                mad=float(row["mad"]),
+                meanad=float(row["meanad"]),
+                lower=float(row["lower"]),
+                upper=float(row["upper"]),
+            )
+    return reference
@@ -0,0 +1,141 @@
+"""
+Minimal reader of bgzip compressed files having a tabix (.tbi) index, used to
+seek straight to regions rather than reading the whole file.
+
+See the SAM specification, section 5, for the BGZF and index layouts.
+"""
+
+import gzip
+import os
+import struct
+import zlib
+
+# width of the windows of the linear index
+LINEAR_SHIFT = 14
+# largest position a tabix index can address
+MAX_POSITION = 1 << 29
+
+
+def reg2bins(beg, end):
+    """
+    bins that may hold features overlapping [beg, end)
+    """
+    end -= 1
+    bins = [0]
+    for shift, offset in ((26, 1), (23, 9), (20, 73), (17, 585), (14, 4681)):
+        bins.extend(range(offset + (beg >> shift), offset + (end >> shift) + 1))
+    return bins
+
+
+def read_tabix(path):
+    """
+    returns dict of sequence name -> (bin -> chunks, linear index)
+    """
+    with gzip.open(path, "rb") as fh:
+        buf = fh.read()
+    if buf[:4] != b"TBI\1":
+        raise ValueError("%s is not a tabix index" % path)
+    n_ref = struct.unpack_from("<i", buf, 4)[0]
+    l_nm = struct.unpack_from("<i", buf, 32)[0]
+    names = buf[36 : 36 + l_nm].split(b"\0")[:n_ref]
+    offset = 36 + l_nm
+    index = dict()
+    for name in names:
+        n_bin = struct.unpack_from("<i", buf, offset)[0]
+        offset += 4
+        bins = dict()
+        for _ in range(n_bin):
+            bin_id, n_chunk = struct.unpack_from("<Ii", buf, offset)
+            offset += 8
+            chunks = struct.unpack_from("<%dQ" % (n_chunk * 2), buf, offset)
+            offset += n_chunk * 16
+            bins[bin_id] = list(zip(chunks[::2], chunks[1::2]))
+        n_intv = struct.unpack_from("<i", buf, offset)[0]
+        offset += 4
+        ioffsets = struct.unpack_from("<%dQ" % n_intv, buf, offset)
+        offset += n_intv * 8
+        index[name.decode()] = (bins, ioffsets)
+    return index
+
+
+def read_chunk(fh, beg, end):
+    """
+    decompressed bytes between two virtual offsets
+    """
+    fh.seek(beg >> 16)
+    blocks = []
+    while True:
+        block_offset = fh.tell()
+        header = fh.read(18)
+        if len(header) < 18:
+            break
+        # total block size, less one, is the BSIZE of the BGZF extra field
+        bsize = struct.unpack_from("<H", header, 16)[0]
+        block = zlib.decompress(header + fh.read(bsize - 17), 31)
+        if block_offset >= end >> 16:
+            blocks.append(block[: end & 0xFFFF])
+            break
+        blocks.append(block)
+    return b"".join(blocks)[beg & 0xFFFF :]
+
+
+def query_chunks(bins, ioffsets, beg, end):
+    """
+    merged chunks of virtual offsets to read for [beg, end)
+    """
+    end = min(end, MAX_POSITION)
+    min_offset = 0
+    if ioffsets:
+        min_offset = ioffsets[min(beg >> LINEAR_SHIFT, len(ioffsets) - 1)]
+    chunks = sorted(
+        c for b in reg2bins(beg, end) for c in bins.get(b, []) if c[1] > min_offset
+    )
+    merged = []
+    for chunk_beg, chunk_end in chunks:
+        if merged and chunk_beg <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], chunk_end)
+        else:
+            merged.append([chunk_beg, chunk_end])
+    return merged
+
+
+def fetch_regions(path, regions):
+    """
+    lines of the tabix indexed `path` that may overlap `regions`, a dict of
+    chromosome, with 'chr' stripped, to list of 0-based, half-open
+    intervals; lines are in file order and may lie just outside of the
+    regions. returns None when `path` has no tabix index.
+    """
+    if not os.path.exists(path + ".tbi"):
+        return None
+    index = read_tabix(path + ".tbi")
+    lines = []
+    with open(path, "rb") as fh:
+        for name, (bins, ioffsets) in index.items():
+            intervals = regions.get(name[3:] if name.startswith("chr") else name)
+            if not intervals:
+                continue
+            chunks = []
+            for beg, end in intervals:
+                chunks.extend(query_chunks(bins, ioffsets, beg, end))
+            # chunks of neighboring regions may overlap
+            read_to = 0
+            for chunk_beg, chunk_end in sorted(chunks):
+                chunk_beg = max(chunk_beg, read_to)
+                if chunk_beg >= chunk_end:
+                    continue
+                text = read_chunk(fh, chunk_beg, chunk_end).decode()
+                lines.extend(text.splitlines(True))
+                read_to = chunk_end
+    return lines
+
+
+def region_lines(fh, path, regions):
+    """
+    lines of `fh`, the open file of `path`, limited to those that may overlap
+    `regions` when `path` has a tabix index
+    """
+    if regions is None:
+        return fh
+    lines = fetch_regions(path, regions)
+    return fh if lines is None else lines
@@ -1,6 +1,26 @@
+import base64
 import gzip
+import json
+import logging
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
 
-import numpy as np
+logger = logging.getLogger("covviz")
+
+# end of regions that are entire chromosomes
+WHOLE_CHROMOSOME = 1 << 62
+# columns of --events; bed3+ having 0-based starts of the first bin of each
+# run and the end of its last
+EVENTS_HEADER = [
+    "#chrom",
+    "start",
+    "end",
+    "sample",
+    "n_bins",
+    "mean_depth",
+    "max_z",
+]
 
 
 def gzopen(f):
@@ -10,39 +30,248 @@ def gzopen(f):
         return open(f)
 
 
-def compare_array(a, b):
-    len_a = len(a)
-    len_b = len(b)
-    if len_a > len_b:
-        b = np.pad(b, (0, len_a - len_b), mode="constant")
-    elif len_b > len_a:
-        a = np.pad(a, (0, len_b - len_a), mode="constant")
-    return a[: np.nonzero(a != b)[0][0]]
+def parse_regions(regions, slop=0):
+    """
+    parse chrom:start-end (1-based, inclusive) or chrom strings into a dict of
+    chromosome, with 'chr' stripped, to sorted, merged, 0-based half-open
+    intervals extended by `slop` on either side
+    """
+    intervals = defaultdict(list)
+    for region in regions:
+        chrom, _, span = region.replace(",", "").partition(":")
+        chrom = chrom[3:] if chrom.startswith("chr") else chrom
+        if span:
+            try:
+                start, end = [int(i) for i in span.split("-")]
+            except ValueError:
+                raise ValueError("unable to parse region: %s" % region)
+            if end < start:
+                raise ValueError("region ends before it starts: %s" % region)
+            start = max(start - 1 - slop, 0)
+            end = end + slop
+        else:
+            start, end = 0, WHOLE_CHROMOSOME
+        intervals[chrom].append([start, end])
+    merged = dict()
+    for chrom, spans in intervals.items():
+        merged[chrom] = []
+        for start, end in sorted(spans):
+            if merged[chrom] and start <= merged[chrom][-1][1]:
+                merged[chrom][-1][1] = max(merged[chrom][-1][1], end)
+            else:
+                merged[chrom].append([start, end])
+    return merged
+
+
+def in_regions(regions, chrom, start, end):
+    """
+    whether [start, end) on chrom, with 'chr' stripped, overlaps regions
+    """
+    for region_start, region_end in regions.get(chrom, []):
+        if start < region_end and end > region_start:
+            return True
+    return False
+
+
+class AnnotationTracks(dict):
+    """
+    annotation tracks of every chromosome, parsed once by the annotation
+    parsers (e.g. `parse_gff` with chroms=None) to be shared across cohorts
+    """
+
+    def extend(self, other):
+        """
+        appends the tracks of other, e.g. parsed in another process
+        """
+        for chrom, data in other.items():
+            if "annotations" not in data:
+                continue
+            section = self.setdefault(chrom, dict())
+            annotations = section.setdefault("annotations", dict())
+            for kind, tracks in data["annotations"].items():
+                annotations.setdefault(kind, []).extend(tracks)
+        return self
+
+    def add_to(self, traces):
+        """
+        adds the tracks of chromosomes plotted in traces
+        """
+        for chrom in traces["chromosomes"]:
+            if chrom in self and "annotations" in self[chrom]:
+                traces[chrom]["annotations"] = self[chrom]["annotations"]
+        return traces
+
+
+def write_partial(traces, path):
+    """
+    write the traces of a subset of chromosomes, as computed by `covviz compute`,
+    as gzipped JSON to be assembled later by `merge_partials`
+    """
+    with gzip.open(path, "wt") as fh:
+        json.dump(traces, fh, separators=(",", ":"))
+
+
+@contextmanager
+def open_events(path):
+    """
+    yields `path` opened for writing significant runs of outliers, with the
+    header written, or None when no path is given
+    """
+    if not path:
+        yield None
+        return
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wt") as fh:
+        print(*EVENTS_HEADER, sep="\t", file=fh)
+        yield fh
+
+
+def merge_partials(paths):
+    """
+    combine partial results into a single traces dict; chromosome order follows
+    the order of `paths`
+    """
+
+    def load(path):
+        with gzopen(path) as fh:
+            return json.load(fh)
+
+    return merge_traces((path, load(path)) for path in paths)
+
+
+def merge_traces(partials):
+    """
+    combine the traces of (name, traces) pairs, each of a subset of the
+    chromosomes, in order; names are used in messages
+    """
+    data = dict(
+        chromosomes=[],
+        sample_list=[],
+        roc=dict(),
+        sample_index=dict(scaled=dict(), roc=dict()),
+    )
+    for name, partial in partials:
+        if not partial["chromosomes"]:
+            logger.info("no plotted chromosomes in %s" % name)
+            continue
+        if not data["sample_list"]:
+            data["sample_list"] = partial["sample_list"]
+        elif data["sample_list"] != partial["sample_list"]:
+            raise ValueError("samples of %s do not match previous results" % name)
+        data["roc"]["x_coords"] = partial["roc"].pop("x_coords")
+        data["sample_index"]["roc"] = partial["sample_index"]["roc"]
+        for sample, positions in partial["sample_index"]["scaled"].items():
+            data["sample_index"]["scaled"].setdefault(sample, dict()).update(positions)
+        for chrom in partial["chromosomes"]:
+            if chrom in data:
+                raise ValueError("chromosome %s was found more than once" % chrom)
+            data["chromosomes"].append(chrom)
+            data[chrom] = partial[chrom]
+            data["roc"][chrom] = partial["roc"][chrom]
+    return data
+
+
+def sample_traces(traces, sample):
+    """
+    the traces of a single sample within those of its cohort: the bounds of
+    the cohort with the sample's outlier traces, called regions, and
+    proportions covered
+    """
+    positions = traces["sample_index"]["scaled"].get(sample, dict())
+    data = dict(
+        chromosomes=traces["chromosomes"],
+        sample_list=[sample],
+        roc=dict(x_coords=traces["roc"]["x_coords"]),
+        sample_index=dict(scaled=dict()),
+    )
+    if sample in traces["sample_index"].get("roc", dict()):
+        data["sample_index"]["roc"] = {sample: 0}
+    for chrom in traces["chromosomes"]:
+        section = dict(traces[chrom])
+        section["samples"] = []
+        if "calls" in section:
+            section["calls"] = [call for call in section["calls"] if call[0] == sample]
+        if chrom in positions:
+            # a copy, as the report rewrites x values in place
+            section["samples"].append(dict(traces[chrom]["samples"][positions[chrom]]))
+            data["sample_index"]["scaled"].setdefault(sample, dict())[chrom] = 0
+        data[chrom] = section
+        roc = traces["roc"].get(chrom, dict())
+        data["roc"][chrom] = {sample: roc[sample]} if sample in roc else dict()
+    return data
+
+
+def sample_ped(ped, sample):
+    """
+    the result of `parse_ped` limited to the row of sample
+    """
+    row = ped["ped_index"].get(sample)
+    rows = [] if row is None else [row]
+    data = dict(ped)
+    data["ped"] = dict(
+        columns=ped["ped"]["columns"],
+        data=[[column[i] for i in rows] for column in ped["ped"]["data"]],
+    )
+    data["ped_index"] = {sample: 0} if rows else dict()
+    if "depth" in ped:
+        # indexcov plots have a point per row of the ped
+        data["depth"] = {
+            plot: {key: [values[i] for i in rows] for key, values in series.items()}
+            for plot, series in ped["depth"].items()
+        }
+    return data
 
 
-def find_common_start(items):
-    if len(items) == 1:
-        return items
+def encode_coords(coords):
+    """
+    encodes a list of positions as runs of a constant step, so that a missing
+    bin costs a single run: [[start, step, count], ...]
+    """
+    runs = []
+    i = 0
+    while i < len(coords):
+        step = coords[i + 1] - coords[i] if i + 1 < len(coords) else 0
+        j = i + 1
+        while j < len(coords) and coords[j] - coords[j - 1] == step:
+            j += 1
+        runs.append([coords[i], step, j - i])
+        i = j
+    return runs
 
-    res = compare_array(np.array(items[0]), np.array(items[1]))
-    if len(items) > 2:
-        for i in range(2, len(items)):
-            res = compare_array(res, np.array(items[i]))
-    return res.tolist()
+
+def decode_coords(runs):
+    """
+    positions of the runs of `encode_coords`
+    """
+    return [start + k * step for start, step, count in runs for k in range(count)]
 
 
 def optimize_coords(data):
     """
-    adds list to incoming dict (data) under key "shared_coords"
-    per chrom, shortens coords to remove redundant, shared starting elements
+    per chrom, replaces coords with their encoding by `encode_coords` and the
+    x values of sample traces with indexes into coords; gaps ("") are kept
     """
-    coords = []
     for chrom in data["chromosomes"]:
-        coords.append(data[chrom]["coords"])
-    # find common starting elements
-    data["shared_coords"] = find_common_start(coords)
-    len_coords = len(data["shared_coords"])
-    # remove common starting elements
+        coords = data[chrom]["coords"]
+        index = {x: i for i, x in enumerate(coords)}
+        for sample in data[chrom]["samples"]:
+            sample["x"] = [index[x] if x != "" else x for x in sample["x"]]
+        data[chrom]["coords"] = encode_coords(coords)
+    return data
+
+
+def compress_chromosomes(data):
+    """
+    replaces the coverage and proportions covered data of each chromosome
+    with its deflate compressed (zlib format) JSON, base64 encoded, under
+    data[chrom]["packed"]; annotations are left as they are
+    """
     for chrom in data["chromosomes"]:
-        data[chrom]["coords"] = data[chrom]["coords"][len_coords:]
+        annotations = data[chrom].pop("annotations", None)
+        section = data[chrom]
+        section["roc"] = data["roc"].pop(chrom)
+        payload = zlib.compress(json.dumps(section, separators=(",", ":")).encode(), 9)
+        data[chrom] = dict(packed=base64.b64encode(payload).decode("ascii"))
+        if annotations is not None:
+            data[chrom]["annotations"] = annotations
     return data
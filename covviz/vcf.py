@@ -2,7 +2,8 @@ import os
 import re
 from itertools import groupby
 
-from .utils import gzopen
+from .tabix import region_lines
+from .utils import gzopen, in_regions
 
 try:
     from itertools import ifilterfalse as filterfalse
@@ -10,13 +11,15 @@ except ImportError:
     from itertools import filterfalse
 
 
-def parse_vcf(path, traces, exclude, regex=None):
+def parse_vcf(path, traces, exclude, regex=None, regions=None, chroms=None):
     """
-    parse a VCFv4.1 file, placing squares per variant
+    parse a VCFv4.1 file, placing squares per variant; regions optionally
+    limits the variants to those intervals, see `utils.parse_regions`, and
+    chroms to those chromosomes, otherwise variants of any are added
     """
     trace_name = os.path.basename(path).partition(".vcf")[0]
     with gzopen(path) as fh:
-        cleaned = filterfalse(lambda i: i[0] == "#", fh)
+        cleaned = filterfalse(lambda i: i[0] == "#", region_lines(fh, path, regions))
 
         info_re = None
         if regex:
@@ -28,8 +31,9 @@ def parse_vcf(path, traces, exclude, regex=None):
             # apply exclusions
             if exclude.findall(chrom):
                 continue
-            if chrom not in traces:
+            if chroms is not None and chrom not in chroms:
                 continue
+            traces.setdefault(chrom, dict())
 
             if not "annotations" in traces[chrom]:
                 traces[chrom]["annotations"] = {"vcf": []}
@@ -44,9 +48,12 @@ def parse_vcf(path, traces, exclude, regex=None):
                     continue
 
                 toks = line.strip().split("\t")
+                pos = int(toks[1])
+                if regions is not None and not in_regions(regions, chrom, pos - 1, pos):
+                    continue
 
                 # not currently converting 0- and 1-based
-                x_vals.append(int(toks[1]))
+                x_vals.append(pos)
 
                 # info = toks[7].replace(";", "<br>")
                 info = toks[7]
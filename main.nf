@@ -101,6 +101,12 @@ Channel
     .from(params.gff ? file(params.gff) : false)
     .set { gff_ch }
 
+// chromosomes to analyze in parallel, keeping their order of the reference
+chroms = fai.readLines().collect { it.split("\t")[0] }.findAll { !(it =~ params.exclude) }
+Channel
+    .from(chroms.withIndex().collect { chrom, idx -> [idx, chrom] })
+    .set { chrom_ch }
+
 process run_indexcov {
     publishDir path: "$outdir/indexcov", mode: "copy"
     label 'indexcov'
@@ -139,13 +145,31 @@ process merge_peds {
     template 'merge_peds.py'
 }
 
+report_ch.mix(merged_ch).into { compute_ped_ch; report_ped_ch }
+
+process compute_coverage {
+    input:
+    set val(idx), val(chrom), file(bed), file(ped) from chrom_ch.combine(bed_ch).combine(compute_ped_ch)
+
+    output:
+    set val(idx), file("${idx}.json.gz") into partial_ch
+
+    script:
+    """
+    covviz compute --chrom '${chrom}' --min-samples ${params.minsamples} --sex-chroms ${params.sexchroms} \
+        --exclude '${params.exclude}' --z-threshold ${params.zthreshold} \
+        --distance-threshold ${params.distancethreshold} --slop ${params.slop} --ped ${ped} \
+        --skip-norm --output ${idx}.json.gz ${bed}
+    """
+}
+
 process build_report {
     publishDir path: "$outdir", mode: "copy", pattern: "*.html", overwrite: true
 
     input:
-    file ped from report_ch.mix(merged_ch).collect()
+    file ped from report_ped_ch.collect()
     file roc from roc_ch
-    file bed from bed_ch
+    file partials from partial_ch.toSortedList({ a, b -> a[0] <=> b[0] }).map { it.collect { it[1] } }
     file gff from gff_ch
 
     output:
@@ -154,8 +178,7 @@ process build_report {
     script:
     gff_opt = params.gff ? "--gff ${gff}" : ""
     """
-    covviz --min-samples ${params.minsamples} --sex-chroms ${params.sexchroms} --exclude '${params.exclude}' \
-        --z-threshold ${params.zthreshold} --distance-threshold ${params.distancethreshold} \
-        --slop ${params.slop} --ped ${ped} ${gff_opt} --skip-norm ${bed}
+    covviz merge --sex-chroms ${params.sexchroms} --exclude '${params.exclude}' \
+        --ped ${ped} ${gff_opt} ${partials}
     """
 }
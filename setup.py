@@ -17,15 +17,16 @@ DESCRIPTION = "Multi-sample coverage browser"
 URL = "https://github.com/brwnj/covviz"
 EMAIL = "brwnjm@gmail.com"
 AUTHOR = "Joe Brown"
-REQUIRES_PYTHON = ">=3.6.0"
+REQUIRES_PYTHON = ">=3.7.0"
 VERSION = "1.3.0"
 
 # What packages are required for this module to be executed?
-REQUIRED = ["Jinja2", "numpy", "pandas"]
+REQUIRED = ["Jinja2", "numpy"]
 
 # What packages are optional?
 EXTRAS = {
-    # 'fancy feature': ['django'],
+    # Arrow IPC/Feather and Parquet input
+    "arrow": ["pyarrow"],
 }
 
 # The rest you shouldn't have to touch too much :)